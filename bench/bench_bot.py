@@ -0,0 +1,209 @@
+"""
+Runs find_mentions() then post_comments() against fake_reddit.FakeReddit, and reports posts per second, requests to
+reddit per post, and per-post latency. Then adds some new comments and runs the bot again, like the next cron run, and
+runs it once more with nothing new.
+
+usage: bench_bot.py [--posts num_posts] [--shape flat|deep|megathread|mixed] [--latency latency_ms]
+                    [--rate requests_per_second] [--pipeline] [database_pickle]
+
+With --pipeline, runs post_comments_pipelined() instead, which posts while find_mentions() is still scanning.
+
+Runs in a temporary folder, so the pickles the bot saves don't touch the real ones.
+"""
+
+import contextlib
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db_core
+import mention_search_posts
+import post_comments
+import tools
+from db_core import CourseDatabase, Department, Course  # need this to de-pickle course_database.pickle
+import fake_reddit
+
+_subreddit_words = ("anyone know if the is hard this quarter prof midterm final dorm parking metro housing dining hall "
+                    "waitlist enrollment section lab I took it last year and it was easier than expected").split()
+
+
+def _pop_option(args: List[str], name: str, default: str) -> str:
+    """Removes --name value from args and returns value, or returns default if --name isn't there.
+
+    :param args: command line arguments
+    :type args: list
+    :param name: option name, like '--posts'
+    :type name: str
+    :param default: value if the option isn't there
+    :type default: str
+    :return: the option's value
+    :rtype: str
+    """
+    if name not in args:
+        return default
+    index = args.index(name)
+    value = args[index + 1]
+    del args[index:index + 2]
+    return value
+
+
+def _make_texts(db: CourseDatabase, rng: random.Random):
+    """Makes a function which returns made-up submission and comment text, some of which mentions courses.
+
+    :param db: database to pick mentioned courses from
+    :type db: CourseDatabase
+    :param rng: random number generator
+    :type rng: random.Random
+    :return: function which returns a new text
+    :rtype: function
+    """
+    courses = [course for dept in db.depts.values() for course in dept.courses.values()]
+
+    def texts() -> str:
+        words = rng.choices(_subreddit_words, k = rng.randint(5, 40))
+        if rng.random() < 0.15:
+            course = rng.choice(courses)
+            words.insert(rng.randrange(len(words)), f'{course.dept.upper()} {course.number.lstrip("0")}')
+        return ' '.join(words)
+
+    return texts
+
+
+def _timed(function, seconds: Dict[str, float], get_post_id, finished: List[float] = None):
+    """Wraps a function of a post, recording how long each call takes.
+
+    :param function: _get_mentions_in_submission() or _post_comment_helper()
+    :type function: function
+    :param seconds: dict to add <post id, seconds> to
+    :type seconds: dict
+    :param get_post_id: function which returns the post id from the function's arguments
+    :type get_post_id: function
+    :param finished: list to add the time each call that returned something true finished at
+    :type finished: list
+    :return: the wrapped function
+    :rtype: function
+    """
+
+    def timed(*args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds[get_post_id(args)] = time.perf_counter() - start
+        if result and finished is not None:
+            finished.append(time.perf_counter())
+        return result
+
+    return timed
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def _run_bot(reddit: fake_reddit.FakeReddit, course_index: db_core.CourseIndex, num_posts: int, label: str,
+             pipeline: bool) -> None:
+    """Runs find_mentions() then post_comments(), or post_comments_pipelined(), and prints what it took.
+
+    :param reddit: the stand-in
+    :type reddit: fake_reddit.FakeReddit
+    :param course_index: index of the database
+    :type course_index: db_core.CourseIndex
+    :param num_posts: how many new posts to scan
+    :type num_posts: int
+    :param label: name of the run to print
+    :type label: str
+    :param pipeline: whether to run post_comments_pipelined()
+    :type pipeline: bool
+    """
+    reddit.calls.clear()
+    reddit.over_limit = 0
+    scan_seconds, post_seconds, comment_times = {}, {}, []
+    original_scan = mention_search_posts._get_mentions_in_submission
+    original_post = post_comments._post_comment_helper
+    mention_search_posts._get_mentions_in_submission = _timed(original_scan, scan_seconds, lambda args: args[1].id)
+    post_comments._post_comment_helper = _timed(original_post, post_seconds, lambda args: args[2].post_id,
+                                                comment_times)
+
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if pipeline:
+                post_comments.post_comments_pipelined(course_index, tools.load_posts_with_comments(), reddit,
+                                                      num_posts)
+            else:
+                found = mention_search_posts.find_mentions(reddit, num_posts)
+                post_comments.post_comments(course_index, tools.load_posts_with_comments(), found, reddit)
+        devnull.close()
+    finally:
+        mention_search_posts._get_mentions_in_submission = original_scan
+        post_comments._post_comment_helper = original_post
+    seconds = time.perf_counter() - start
+
+    num_calls = sum(reddit.calls.values())
+    per_post = [scan_seconds[post_id] + post_seconds.get(post_id, 0) for post_id in scan_seconds]
+    print(f'{label}: {num_posts} posts in {seconds:.2f} s, {num_posts / seconds:.1f} posts/sec, '
+          f'{num_calls / num_posts:.2f} requests/post, {reddit.over_limit} requests over the rate limit')
+    if comment_times:
+        print(f'    first comment posted or edited after {comment_times[0] - start:.2f} s')
+    print('    requests: ' + ', '.join(f'{kind} {count}' for kind, count in sorted(reddit.calls.items())))
+    print(f'    per-post latency: p50 {_percentile(per_post, 0.5) * 1000:.0f} ms, '
+          f'p99 {_percentile(per_post, 0.99) * 1000:.0f} ms. '
+          f'request latency: p50 {_percentile(reddit.call_seconds, 0.5) * 1000:.0f} ms, '
+          f'p99 {_percentile(reddit.call_seconds, 0.99) * 1000:.0f} ms')
+    reddit.call_seconds.clear()
+
+
+def main():
+    """Runs the benchmark."""
+    args = sys.argv[1:]
+    num_posts = int(_pop_option(args, '--posts', '100'))
+    shape = _pop_option(args, '--shape', 'mixed')
+    latency = float(_pop_option(args, '--latency', '50')) / 1000
+    rate = float(_pop_option(args, '--rate', '50'))
+    pipeline = '--pipeline' in args
+    if pipeline:
+        args.remove('--pipeline')
+    pickle_path = args[0] if args else db_core._database_pickle_path
+
+    with open(pickle_path, 'rb') as file:
+        db = pickle.load(file)
+    file.close()
+    course_index = db_core.CourseIndex(db)
+
+    rng = random.Random(0)
+    texts = _make_texts(db, rng)
+    reddit = fake_reddit.FakeReddit(latency = latency, requests_per_second = rate)
+    for _ in range(num_posts):
+        if shape == 'mixed':
+            thread_shape = rng.choices(['flat', 'deep', 'megathread'], weights = [60, 30, 10])[0]
+        else:
+            thread_shape = shape
+        reddit.add_thread(thread_shape, texts)
+    print(f'{num_posts} posts, {len(reddit.comments):,} comments, shape {shape}, '
+          f'{latency * 1000:.0f} ms latency, {rate:.0f} requests/sec')
+
+    # the stand-in is thread-safe, so the threads which would each log in can share it
+    tools.auth_reddit = lambda handler = None: reddit
+
+    os.chdir(tempfile.mkdtemp())
+    os.mkdir('pickle')
+
+    _run_bot(reddit, course_index, num_posts, 'first run', pipeline)
+
+    # a few posts get new comments before the next run
+    for submission in rng.sample(reddit.submissions, max(1, num_posts // 10)):
+        for _ in range(3):
+            reddit.add_comment(submission, None, 'someone', texts())
+    _run_bot(reddit, course_index, num_posts, 'next run', pipeline)
+
+    # nothing changed since the last run
+    _run_bot(reddit, course_index, num_posts, 'unchanged run', pipeline)
+
+
+main()
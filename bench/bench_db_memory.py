@@ -0,0 +1,106 @@
+"""
+Reports how much memory each course takes and how long the course database takes to unpickle,
+with the old plain classes and with the current slotted classes.
+
+usage: bench_db_memory.py [database_pickle]
+"""
+
+import gc
+import io
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db_core
+
+
+class _PlainCourseDatabase:
+    """CourseDatabase before __slots__."""
+
+
+class _PlainDepartment:
+    """Department before __slots__."""
+
+
+class _PlainCourse:
+    """Course before __slots__."""
+
+
+_plain_classes = {'CourseDatabase': _PlainCourseDatabase, 'Department': _PlainDepartment, 'Course': _PlainCourse}
+_slotted_classes = {'CourseDatabase': db_core.CourseDatabase, 'Department': db_core.Department,
+                    'Course': db_core.Course}
+
+
+class _Unpickler(pickle.Unpickler):
+    """Loads the database classes from whichever module they were pickled from into the given classes."""
+
+    def __init__(self, file, classes: dict):
+        super().__init__(file)
+        self.classes = classes
+
+    def find_class(self, module_name: str, name: str):
+        if name in self.classes:
+            return self.classes[name]
+        return super().find_class(module_name, name)
+
+
+def _load(data: bytes, classes: dict):
+    """Unpickles the database with the given classes.
+
+    :param data: pickled database
+    :type data: bytes
+    :param classes: dict of <class name, class to load it as>
+    :type classes: dict
+    :return: the database
+    """
+    return _Unpickler(io.BytesIO(data), classes).load()
+
+
+def _measure(label: str, data: bytes, classes: dict) -> None:
+    """Prints unpickle time and memory per course.
+
+    :param label: name to print
+    :type label: str
+    :param data: pickled database
+    :type data: bytes
+    :param classes: dict of <class name, class to load it as>
+    :type classes: dict
+    """
+    times = []
+    for _ in range(5):
+        gc.collect()
+        start = time.perf_counter()
+        db = _load(data, classes)
+        times.append(time.perf_counter() - start)
+        del db
+
+    gc.collect()
+    tracemalloc.start()
+    db = _load(data, classes)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    num_courses = db.num_courses
+    print(f'{label}: {len(data):,} byte pickle, unpickle {min(times) * 1000:.1f} ms (best of 5), '
+          f'{memory:,} bytes in memory, {memory / num_courses:.0f} bytes/course for {num_courses} courses')
+
+
+def main():
+    """Measures the database pickle with the old and new classes."""
+    path = sys.argv[1] if len(sys.argv) > 1 else db_core._database_pickle_path
+    with open(path, 'rb') as file:
+        data = file.read()
+    file.close()
+
+    _measure('plain classes, this pickle', data, _plain_classes)
+    _measure('slotted classes, this pickle', data, _slotted_classes)
+
+    compact = pickle.dumps(_load(data, _slotted_classes))
+    _measure('slotted classes, migrated pickle', compact, _slotted_classes)
+
+
+main()
@@ -0,0 +1,131 @@
+"""
+Times downloading every registrar page from a local stand-in for the registrar, one at a time and then in parallel.
+
+usage: bench_fetch.py [--save] pages_dir [latency_ms]
+
+The stand-in serves <pages_dir>/<dept>.html with an ETag, answers 304 to a matching If-None-Match, and waits
+latency_ms before each response to act like a real network.
+Use --save to first download the real pages from the registrar into pages_dir.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db_core
+
+
+def _make_handler(pages_dir: str, latency: float):
+    """Makes a request handler class which serves saved pages.
+
+    :param pages_dir: folder with saved pages
+    :type pages_dir: str
+    :param latency: seconds to wait before each response
+    :type latency: float
+    :return: request handler class
+    :rtype: type
+    """
+
+    class SavedPageHandler(BaseHTTPRequestHandler):
+        """Serves <pages_dir>/<dept>.html for any url ending in /<dept>.html."""
+
+        def do_GET(self):
+            time.sleep(latency)
+            path = os.path.join(pages_dir, os.path.basename(self.path))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as file:
+                body = file.read()
+            file.close()
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    return SavedPageHandler
+
+
+class _StandInServer(ThreadingHTTPServer):
+    """Threaded server with a listen queue big enough for every worker to connect at once."""
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def _save_pages(pages_dir: str) -> None:
+    """Downloads every registrar page into pages_dir.
+
+    :param pages_dir: folder to save pages in
+    :type pages_dir: str
+    """
+    os.makedirs(pages_dir, exist_ok = True)
+    for page_name, html in db_core._fetch_pages(db_core._all_departments + ['lit']).items():
+        with open(os.path.join(pages_dir, page_name + '.html'), 'w', encoding = 'utf-8') as file:
+            file.write(html)
+        file.close()
+
+
+def _time_fetch(num_workers: int) -> float:
+    """Downloads every page from the stand-in and returns how long it took.
+
+    :param num_workers: how many pages to download at the same time
+    :type num_workers: int
+    :return: seconds taken
+    :rtype: float
+    """
+    start = time.perf_counter()
+    pages = db_core._fetch_pages(db_core._all_departments + ['lit'], num_workers, requests_per_second = 1000)
+    elapsed = time.perf_counter() - start
+    print(f'{num_workers:>3} worker(s): {len(pages)} pages in {elapsed:.2f} s')
+    return elapsed
+
+
+def main():
+    """Starts the stand-in and times serial and parallel downloads."""
+    args = sys.argv[1:]
+    if args and args[0] == '--save':
+        _save_pages(args[1])
+        args = args[1:]
+
+    if not args:
+        print(__doc__)
+        exit(1)
+
+    pages_dir = args[0]
+    latency = float(args[1]) / 1000 if len(args) > 1 else 0.1
+
+    server = _StandInServer(('127.0.0.1', 0), _make_handler(pages_dir, latency))
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    db_core._registrar_url = f'http://127.0.0.1:{server.server_port}/'
+
+    serial = _time_fetch(1)
+    for num_workers in (4, 16, 32):
+        print(f'    speedup: {serial / _time_fetch(num_workers):.1f}x')
+
+    page_infos = {name: db_core.PageInfo() for name in db_core._all_departments + ['lit']}
+    db_core._fetch_pages(list(page_infos), page_infos = page_infos)
+    start = time.perf_counter()
+    pages = db_core._fetch_pages(list(page_infos), requests_per_second = 1000, page_infos = page_infos)
+    num_not_modified = sum(1 for html in pages.values() if html is None)
+    print(f'conditional: {num_not_modified} of {len(pages)} pages not modified in {time.perf_counter() - start:.2f} s')
+
+    server.shutdown()
+
+
+main()
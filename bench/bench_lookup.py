@@ -0,0 +1,85 @@
+"""
+Compares opening the course database and looking up courses in each on-disk format.
+
+usage: bench_lookup.py [database_pickle]
+
+Writes the other formats from the pickle into a temporary folder, then for each format prints how long it takes
+to open and the mean latency of looking up a mix of courses that exist and courses that don't.
+"""
+
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from db_core import CourseDatabase, Department, Course  # need this to de-pickle course_database.pickle
+import db_core
+import db_mmap
+import db_sqlite
+
+
+def _time_lookups(db, keys: list) -> float:
+    """Looks up every key and returns the mean seconds per lookup.
+
+    :param db: database with a get_course() method
+    :param keys: list of (dept, number)
+    :type keys: list
+    :return: mean seconds per lookup
+    :rtype: float
+    """
+    start = time.perf_counter()
+    for dept, number in keys:
+        db.get_course(dept, number)
+    return (time.perf_counter() - start) / len(keys)
+
+
+def main():
+    """Times opening and lookups for every format."""
+    pickle_path = sys.argv[1] if len(sys.argv) > 1 else db_core._database_pickle_path
+    with open(pickle_path, 'rb') as file:
+        db = pickle.load(file)
+    file.close()
+
+    random.seed(0)
+    real_keys = [(c.dept, c.number) for d in db.depts.values() for c in d.courses.values()]
+    keys = random.choices(real_keys, k = 20000) + [('cmps', '999Z'), ('zzzz', '001')] * 1000
+    random.shuffle(keys)
+
+    temp_dir = tempfile.mkdtemp()
+    store_path = os.path.join(temp_dir, 'course_store.bin')
+    db_mmap.write_store(db, store_path)
+    sqlite_path = os.path.join(temp_dir, 'course_database.sqlite')
+    sqlite_db = db_sqlite.SqliteCourseDatabase(sqlite_path)
+    sqlite_db.write_database(db)
+    sqlite_db.close()
+
+    def open_pickle():
+        with open(pickle_path, 'rb') as pickle_file:
+            return pickle.load(pickle_file)
+
+    openers = [('pickle', open_pickle),
+               ('mmap', lambda: db_mmap.MappedCourseStore(store_path)),
+               ('sqlite', lambda: db_sqlite.SqliteCourseDatabase(sqlite_path))]
+
+    for name, opener in openers:
+        start = time.perf_counter()
+        opened = opener()
+        open_time = time.perf_counter() - start
+
+        for dept, number in keys[:2000]:
+            expected = db.get_course(dept, number)
+            found = opened.get_course(dept, number)
+            assert (expected is None and found is None) or \
+                (found.dept, found.number, found.name, found.description) == \
+                (expected.dept, expected.number, expected.name, expected.description)
+
+        lookup_time = _time_lookups(opened, keys)
+        print(f'{name.ljust(6)}: open {open_time * 1000:8.2f} ms, lookup {lookup_time * 1e6:6.2f} us mean '
+              f'({len(keys):,} lookups)')
+
+
+main()
@@ -0,0 +1,93 @@
+"""
+Times mention_parse.parse_string() over a corpus of /r/UCSC comments and reports mentions found per second.
+
+usage: bench_mentions.py [--fetch num_comments] [--processes num_processes] corpus_pickle
+
+The corpus is a pickled list of comment bodies. Use --fetch to first download the newest comments on /r/UCSC into it,
+which needs pickle/access_information.pickle like the bot does. Use --processes to also time mention_parse.parse_many()
+with a process pool.
+"""
+
+import os
+import pickle
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mention_parse
+
+_repeats = 5
+
+
+def _fetch_corpus(num_comments: int) -> List[str]:
+    """Downloads the newest comments on /r/UCSC.
+
+    :param num_comments: how many comments to download
+    :type num_comments: int
+    :return: the comment bodies
+    :rtype: list
+    """
+    import tools  # only needed to download, and it needs praw set up
+    reddit = tools.auth_reddit()
+    return [comment.body for comment in reddit.get_comments('ucsc', limit = num_comments)]
+
+
+def _time_corpus(corpus: List[str]) -> float:
+    """Parses every comment in the corpus.
+
+    :param corpus: comment bodies
+    :type corpus: list
+    :return: seconds taken
+    :rtype: float
+    """
+    start = time.perf_counter()
+    for body in corpus:
+        mention_parse.parse_string(body)
+    return time.perf_counter() - start
+
+
+def main():
+    """Runs the benchmark."""
+    args = sys.argv[1:]
+
+    num_processes = None
+    if '--processes' in args:
+        index = args.index('--processes')
+        num_processes = int(args[index + 1])
+        del args[index:index + 2]
+
+    if '--fetch' in args:
+        index = args.index('--fetch')
+        num_comments = int(args[index + 1])
+        del args[index:index + 2]
+        with open(args[0], 'wb') as file:
+            pickle.dump(_fetch_corpus(num_comments), file)
+        file.close()
+
+    with open(args[0], 'rb') as file:
+        corpus = pickle.load(file)
+    file.close()
+
+    num_mentions = sum(len(mention_parse.parse_string(body)) for body in corpus)
+    num_chars = sum(len(body) for body in corpus)
+    print(f'{len(corpus):,} comments, {num_chars:,} characters, {num_mentions:,} mentions')
+
+    seconds = min(_time_corpus(corpus) for _ in range(_repeats))
+    print(f'best of {_repeats}: {seconds * 1000:.1f} ms, '
+          f'{len(corpus) / seconds:,.0f} comments/sec, '
+          f'{num_mentions / seconds:,.0f} mentions/sec, '
+          f'{num_chars / seconds / 1e6:.1f} MB/sec')
+
+    if num_processes is not None:
+        start = time.perf_counter()
+        results = list(mention_parse.parse_many(enumerate(corpus), processes = num_processes))
+        seconds = time.perf_counter() - start
+        assert results == [(index, mention_parse.parse_string(body)) for index, body in enumerate(corpus)]
+        print(f'parse_many() with {num_processes} processes: {seconds * 1000:.1f} ms, '
+              f'{len(corpus) / seconds:,.0f} comments/sec, '
+              f'{num_mentions / seconds:,.0f} mentions/sec')
+
+
+main()
@@ -0,0 +1,126 @@
+"""
+Parses every registrar page in the snapshot without the network, and times it.
+
+usage: bench_parse.py [--import pages_dir] [snapshot_dir]
+
+For each parser backend, prints parse time and peak memory per page, and a hash of the printed database. Then times
+parsing with a process pool. If a parser
+change keeps the hash the same, it builds the exact same database. Use --import to first add the <dept>.html files in
+pages_dir (like the ones saved by bench_fetch.py --save) to the snapshot.
+"""
+
+import contextlib
+import hashlib
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, Tuple
+from bs4 import FeatureNotFound
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db_core
+import db_snapshot
+
+# every (db_core.PARSER, db_core.PARSE_ONLY_MAIN_CONTENT) to compare
+_backends = [('html.parser', False), ('html.parser', True), ('lxml', False), ('lxml', True)]
+
+
+def _import_pages(snapshot: db_snapshot.Snapshot, pages_dir: str) -> None:
+    """Adds saved pages to the snapshot.
+
+    :param snapshot: snapshot to add to
+    :type snapshot: db_snapshot.Snapshot
+    :param pages_dir: folder with <page name>.html files
+    :type pages_dir: str
+    """
+    for page_name in db_core._all_departments + ['lit']:
+        with open(os.path.join(pages_dir, page_name + '.html'), encoding = 'utf-8') as file:
+            snapshot.add(page_name, file.read())
+        file.close()
+    snapshot.save_index()
+
+
+def _parse_all(pages: Dict[str, str], trace_memory: bool = False) -> Tuple[db_core.CourseDatabase, Dict[str, float]]:
+    """Parses every page with the current db_core.PARSER and db_core.PARSE_ONLY_MAIN_CONTENT.
+
+    :param pages: dict of <page name, html>
+    :type pages: dict
+    :param trace_memory: measure each page's peak memory instead of its parse time
+    :type trace_memory: bool
+    :return: the database, and a dict of <page name, seconds> or <page name, peak bytes>
+    :rtype: tuple
+    """
+    db = db_core.CourseDatabase()
+    measurements = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for page_name, html in pages.items():
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            depts = db_core._parse_page(page_name, html)
+            if trace_memory:
+                measurements[page_name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                measurements[page_name] = time.perf_counter() - start
+            for dept in depts:
+                db.add_dept(dept)
+    return db, measurements
+
+
+def main():
+    """Parses every page in the snapshot with each parser backend and prints timings."""
+    args = sys.argv[1:]
+    import_dir = None
+    if args and args[0] == '--import':
+        import_dir = args[1]
+        args = args[2:]
+
+    snapshot = db_snapshot.Snapshot(*args)
+    if import_dir is not None:
+        _import_pages(snapshot, import_dir)
+    db_core._snapshot = snapshot
+    db_core.OFFLINE = True
+
+    pages = {name: snapshot.get(name) for name in db_core._all_departments + ['lit']}
+    total_bytes = sum(len(html) for html in pages.values())
+    print(f'{len(pages)} pages, {total_bytes:,} bytes')
+
+    for parser, parse_only_main_content in _backends:
+        db_core.PARSER = parser
+        db_core.PARSE_ONLY_MAIN_CONTENT = parse_only_main_content
+        try:
+            db, times = _parse_all(pages)
+        except FeatureNotFound:
+            print(f'\n{parser}: not installed')
+            continue
+        _, peaks = _parse_all(pages, trace_memory = True)
+
+        total = sum(times.values())
+        print(f'\n{parser}, only main content: {parse_only_main_content}')
+        print(f'   {total:.2f} s total, {total / len(pages) * 1000:.1f} ms/page mean, '
+              f'{max(times.values()) * 1000:.1f} ms slowest ({max(times, key = times.get)})')
+        print(f'   peak memory {sum(peaks.values()) / len(peaks) / 2**20:.1f} MiB/page mean, '
+              f'{max(peaks.values()) / 2**20:.1f} MiB largest ({max(peaks, key = peaks.get)})')
+        print(f'   {db.num_courses} courses in {len(db.depts)} departments, '
+              f'database hash {hashlib.sha256(str(db).encode("utf-8")).hexdigest()[:16]}')
+
+    db_core.PARSER = 'html.parser'
+    db_core.PARSE_ONLY_MAIN_CONTENT = True
+    num_workers = os.cpu_count()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        parsed = db_core._parse_pages(pages, num_workers)
+        elapsed = time.perf_counter() - start
+    db = db_core.CourseDatabase()
+    for depts in parsed.values():
+        for dept in depts:
+            db.add_dept(dept)
+    print(f'\nhtml.parser, only main content: True, {num_workers} worker processes')
+    print(f'   {elapsed:.2f} s total, {db.num_courses} courses in {len(db.depts)} departments, '
+          f'database hash {hashlib.sha256(str(db).encode("utf-8")).hexdigest()[:16]}')
+
+
+main()
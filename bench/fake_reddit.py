@@ -0,0 +1,289 @@
+"""
+Stand-in for praw.Reddit that keeps a made-up /r/UCSC in memory, so the bot can be run without reddit.
+
+It has the parts of praw's API the bot uses. Every call that would be a request to reddit waits for a token like
+tools.TokenBucketHandler does, then waits a network latency, and is counted. The stand-in also checks the calls against
+its own rate limit, like reddit does, and counts the calls that went over.
+"""
+
+import collections
+import itertools
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from rate_limit import TokenBucket
+
+# shapes of comment trees: (number of comments, deepest reply depth, number of "load more comments" stubs)
+shapes = {'flat': (40, 1, 0),
+          'deep': (120, 25, 6),
+          'megathread': (600, 8, 30)}
+
+_comments_per_stub = 20
+
+
+class FakeRedditor:
+    """Author of a submission or comment."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakeComment:
+    """Comment with the attributes of a praw.objects.Comment the bot reads."""
+
+    def __init__(self, reddit: 'FakeReddit', comment_id: str, submission_id: str, author: str, body: str):
+        self._reddit = reddit
+        self.id = comment_id
+        self.fullname = 't1_' + comment_id
+        self.link_id = 't3_' + submission_id
+        self.author = FakeRedditor(author)
+        self.body = body
+        self.created_utc = reddit.now()
+        self.replies: List[FakeComment] = []
+
+    def edit(self, text: str) -> 'FakeComment':
+        self._reddit.request('edit')
+        self.body = text
+        return self
+
+
+class FakeSubmission:
+    """Submission with the attributes and methods of a praw.objects.Submission the bot uses."""
+
+    def __init__(self, reddit: 'FakeReddit', submission_id: str, author: str, title: str, selftext: str):
+        self._reddit = reddit
+        self.id = submission_id
+        self.fullname = 't3_' + submission_id
+        self.author = FakeRedditor(author)
+        self.title = title
+        self.selftext = selftext
+        self.created_utc = reddit.now()
+        self._tree: List[FakeComment] = []  # top level comments
+        self._all_comments: List[FakeComment] = []
+        self._hidden = set()  # ids of comments behind a "load more comments" stub
+        self._num_stubs = 0
+        self._loaded = False  # whether the comments have been requested
+        self._expanded = False
+
+    @property
+    def num_comments(self) -> int:
+        return len(self._all_comments)
+
+    def _load(self) -> None:
+        if not self._loaded:
+            self._reddit.request('comments')
+            self._loaded = True
+
+    @property
+    def comments(self) -> List[FakeComment]:
+        self._load()
+        if self._expanded or not self._hidden:
+            return self._tree
+        return [comment for comment in self._tree if comment.id not in self._hidden]
+
+    def replace_more_comments(self, limit: Optional[int] = 32, threshold: int = 1) -> list:
+        self._load()
+        if self._expanded:
+            return []
+        num_requests = self._num_stubs if limit is None else min(limit, self._num_stubs)
+        for _ in range(num_requests):
+            self._reddit.request('more')
+        self._expanded = num_requests == self._num_stubs
+        return []
+
+    def add_comment(self, text: str) -> FakeComment:
+        self._reddit.request('reply')
+        return self._reddit.add_comment(self, None, self._reddit.bot_name, text)
+
+
+class _FakeSubreddit:
+    """The subreddit's listing of new submissions."""
+
+    def __init__(self, reddit: 'FakeReddit'):
+        self._reddit = reddit
+
+    def get_new(self, limit: int = 25):
+        return self._reddit.listing('new', self._reddit.submissions, limit)
+
+
+class FakeReddit:
+    """Made-up /r/UCSC with the methods of praw.Reddit the bot uses."""
+
+    def __init__(self, latency: float = 0.05, requests_per_second: float = 50, burst: float = 10,
+                 server_requests_per_second: float = None, seed: int = 0):
+        """
+        :param latency: mean seconds each request takes
+        :type latency: float
+        :param requests_per_second: rate the client side paces requests at, like tools.TokenBucketHandler
+        :type requests_per_second: float
+        :param burst: largest burst of requests the client side allows
+        :type burst: float
+        :param server_requests_per_second: rate limit the stand-in checks requests against. Defaults to
+            requests_per_second.
+        :type server_requests_per_second: float
+        :param seed: seed for the made-up latencies and threads
+        :type seed: int
+        """
+        self.latency = latency
+        self.bot_name = 'ucsc-class-info-bot'
+        self.submissions: List[FakeSubmission] = []  # newest first
+        self.comments: List[FakeComment] = []  # newest first
+        self.calls = collections.Counter()  # <kind of request, count>
+        self.over_limit = 0  # requests that went over the stand-in's rate limit
+        self.call_seconds: List[float] = []
+
+        self._random = random.Random(seed)
+        self._bucket = TokenBucket(requests_per_second, burst)
+        self._server_rate = server_requests_per_second or requests_per_second
+        self._server_burst = burst
+        self._recent_calls = collections.deque()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._clock = 1500000000.0
+        self._things: Dict[str, object] = {}  # <fullname, submission or comment>
+
+        # what the X-Ratelimit headers of the newest response would say, like tools.TokenBucketHandler keeps
+        self.handler = self
+        self.ratelimit_remaining: Optional[float] = None
+        self.ratelimit_reset_at = 0.0
+
+    def now(self) -> float:
+        """Made-up created_utc that goes up by a second for every submission or comment made."""
+        self._clock += 1
+        return self._clock
+
+    def request(self, kind: str) -> None:
+        """Acts out one request to reddit.
+
+        :param kind: what the request is for, like 'comments' or 'reply'
+        :type kind: str
+        """
+        self._bucket.acquire()
+        start = time.monotonic()
+        with self._lock:
+            self.calls[kind] += 1
+            # reddit-side check: no more than a second's worth of requests, plus the burst, in any second
+            self._recent_calls.append(start)
+            while self._recent_calls[0] < start - 1:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) > self._server_rate + self._server_burst:
+                self.over_limit += 1
+            self.ratelimit_remaining = max(0, self._server_rate + self._server_burst - len(self._recent_calls))
+            self.ratelimit_reset_at = self._recent_calls[0] + 1
+            latency = self._random.uniform(0.5, 1.5) * self.latency
+        time.sleep(latency)
+        with self._lock:
+            self.call_seconds.append(time.monotonic() - start)
+
+    def listing(self, kind: str, things: list, limit: Optional[int]):
+        """Yields things from a listing, one request per page of 100 like reddit.
+
+        :param kind: what the listing is, to count requests by
+        :type kind: str
+        :param things: the whole listing
+        :type things: list
+        :param limit: most things to yield, or None for every thing
+        :type limit: int
+        """
+        things = list(things if limit is None else things[:limit])
+        for start in range(0, len(things), 100):
+            self.request(kind)
+            yield from things[start:start + 100]
+
+    def add_submission(self, title: str, selftext: str) -> FakeSubmission:
+        """Posts a submission.
+
+        :param title: title of the submission
+        :type title: str
+        :param selftext: text of the submission
+        :type selftext: str
+        :return: the submission
+        :rtype: FakeSubmission
+        """
+        submission = FakeSubmission(self, f'p{next(self._ids):x}', f'user{self._random.randrange(500)}', title,
+                                    selftext)
+        self.submissions.insert(0, submission)
+        self._things[submission.fullname] = submission
+        return submission
+
+    def add_comment(self, submission: FakeSubmission, parent: Optional[FakeComment], author: str,
+                    body: str) -> FakeComment:
+        """Posts a comment.
+
+        :param submission: submission the comment is in
+        :type submission: FakeSubmission
+        :param parent: comment being replied to, or None for a top level comment
+        :type parent: FakeComment
+        :param author: name of the commenter
+        :type author: str
+        :param body: text of the comment
+        :type body: str
+        :return: the comment
+        :rtype: FakeComment
+        """
+        comment = FakeComment(self, f'c{next(self._ids):x}', submission.id, author, body)
+        (parent.replies if parent is not None else submission._tree).append(comment)
+        submission._all_comments.append(comment)
+        submission._expanded = False
+        self.comments.insert(0, comment)
+        self._things[comment.fullname] = comment
+        return comment
+
+    def add_thread(self, shape: str, texts) -> FakeSubmission:
+        """Posts a submission with a tree of comments in one of the shapes.
+
+        :param shape: key of shapes
+        :type shape: str
+        :param texts: function which returns the text of a new submission or comment
+        :type texts: function
+        :return: the submission
+        :rtype: FakeSubmission
+        """
+        num_comments, max_depth, num_stubs = shapes[shape]
+        submission = self.add_submission(texts(), texts())
+        depths = {}
+        for _ in range(num_comments):
+            candidates = [comment for comment in submission._all_comments[-50:] if depths[comment.id] < max_depth]
+            parent = self._random.choice(candidates) if candidates and self._random.random() < 0.7 else None
+            comment = self.add_comment(submission, parent, f'user{self._random.randrange(500)}', texts())
+            depths[comment.id] = 1 if parent is None else depths[parent.id] + 1
+
+        # the newest top level comments, and their replies, are the ones reddit leaves behind "load more comments"
+        submission._num_stubs = num_stubs
+        num_hidden = min(len(submission._tree), num_stubs * _comments_per_stub)
+        submission._hidden = {comment.id for comment in submission._tree[len(submission._tree) - num_hidden:]}
+        return submission
+
+    def get_subreddit(self, subreddit_name: str) -> _FakeSubreddit:
+        return _FakeSubreddit(self)
+
+    def get_comments(self, subreddit: str, limit: int = 25):
+        return self.listing('recent comments', self.comments, limit)
+
+    def get_submission(self, submission_id: str) -> FakeSubmission:
+        self.request('submission')
+        submission = self._things['t3_' + submission_id]
+        submission._loaded = True  # the submission page comes with its comments
+        return submission
+
+    def get_info(self, thing_id, limit: Optional[int] = None):
+        """Looks up submissions or comments by fullname, 100 per request like reddit.
+
+        :param thing_id: a fullname, or a list of them
+        :type thing_id: str, list
+        :param limit: most things to return from a list
+        :type limit: int
+        :return: the thing, or a list of the things found
+        :rtype: FakeSubmission, FakeComment, list
+        """
+        if isinstance(thing_id, str):
+            self.request('info')
+            return self._things.get(thing_id)
+        things = []
+        for start in range(0, len(thing_id), 100):
+            self.request('info')
+            things.extend(self._things[fullname] for fullname in thing_id[start:start + 100]
+                          if fullname in self._things)
+        return things[:limit] if limit else things
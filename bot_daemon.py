@@ -0,0 +1,329 @@
+"""
+Runs the bot until it is stopped: watches /r/UCSC for new submissions and comments, and replies as soon as courses are
+mentioned, instead of scanning a batch of posts then exiting.
+
+Submissions and comments flow through bounded queues, from the stream threads to the scanner to the poster. If posting
+falls behind, the queues fill up and the streams wait, instead of events piling up in memory. The course database and
+the reddit login are loaded once, when the daemon starts.
+
+praw 3's Reddit isn't thread-safe, so each thread makes its requests through its own login. The logins share one
+handler, and so one rate limit. An unexpected error in a thread is printed and the thread carries on, instead of it
+dying and the daemon stopping.
+"""
+
+from typing import Dict, List, Optional
+import queue
+import threading
+import time
+import traceback
+import praw
+import requests
+import db_core
+import tools
+import mention_search_posts
+from mention_search_posts import PostWithMentions
+from post_comments import _post_comment_helper, CHECKPOINT_EVERY
+from write_scheduler import WriteScheduler
+
+# most submissions and comments waiting to be scanned, and most posts waiting for a comment to be posted or edited
+EVENT_QUEUE_SIZE = 100
+POST_QUEUE_SIZE = 20
+
+# how many submissions and comments each stream request asks for
+STREAM_LIMIT = 100
+
+# seconds between saving scan checkpoints, and seconds to wait before restarting a stream that failed
+CHECKPOINT_SAVE_SECONDS = 60
+STREAM_RETRY_SECONDS = 30
+
+# most seconds the poster waits for a post before checking whether the daemon is stopping
+POSTER_WAKE_SECONDS = 1
+
+# errors from reddit that shouldn't stop the daemon
+_reddit_errors = (praw.errors.HTTPException, requests.RequestException)
+
+
+def _run_stream(name: str, stream_function, events: queue.Queue) -> None:
+    """Puts every item from a stream in the event queue, forever. Runs in its own thread.
+
+    :param name: name of the stream to print in errors
+    :type name: str
+    :param stream_function: function which returns a praw.helpers stream
+    :type stream_function: function
+    :param events: queue to put submissions and comments in
+    :type events: queue.Queue
+    """
+    while True:
+        try:
+            for item in stream_function():
+                events.put(item)  # waits while the queue is full
+        except _reddit_errors as error:
+            print(f'{name} stream failed, restarting in {STREAM_RETRY_SECONDS} seconds: {error}')
+        except Exception:
+            print(f'{name} stream failed unexpectedly, restarting in {STREAM_RETRY_SECONDS} seconds:')
+            traceback.print_exc()
+        time.sleep(STREAM_RETRY_SECONDS)
+
+
+def _expand_into_checkpoint(submission: praw.objects.Submission, checkpoint: tools.ScanCheckpoint) -> None:
+    """Reads a submission's whole comment tree into its checkpoint.
+
+    :param submission: a praw submission object
+    :type submission: praw.objects.Submission
+    :param checkpoint: scan checkpoint of the submission
+    :type checkpoint: tools.ScanCheckpoint
+    """
+    submission.replace_more_comments(limit = None, threshold = 0)
+    mention_search_posts.merge_new_comments(checkpoint, praw.helpers.flatten_tree(submission.comments))
+    checkpoint.num_comments = submission.num_comments
+
+
+def _scan_event(reddit: praw.Reddit, item, checkpoints: Dict[str, tools.ScanCheckpoint],
+                post_mentions: Dict[str, PostWithMentions]) -> PostWithMentions:
+    """Updates what is known about the submission a new submission or comment is in.
+
+    :param reddit: authorized reddit praw object
+    :type reddit: praw.Reddit
+    :param item: a new submission or comment from a stream
+    :type item: praw.objects.Submission, praw.objects.Comment
+    :param checkpoints: dict of <submission id, ScanCheckpoint>
+    :type checkpoints: dict
+    :param post_mentions: dict of <submission id, PostWithMentions of its title and selftext>
+    :type post_mentions: dict
+    :return: every mention in the submission so far
+    :rtype: PostWithMentions
+    """
+    if isinstance(item, praw.objects.Submission):
+        submission_id = item.id
+        post_mentions[submission_id] = _get_post_mentions(item)
+        checkpoint = checkpoints.get(submission_id)
+        if checkpoint is None:
+            checkpoint = tools.ScanCheckpoint(item.created_utc)
+            if item.num_comments > 0:
+                # seen for the first time with comments already, like when the daemon starts. item belongs to the
+                # stream's login, so get the submission again through this thread's.
+                _expand_into_checkpoint(reddit.get_submission(submission_id = submission_id), checkpoint)
+    else:
+        submission_id = item.link_id[3:]  # strip 't3_'
+        checkpoint = checkpoints.get(submission_id)
+        if submission_id not in post_mentions or checkpoint is None:
+            # one request for the submission, which comes with its comments
+            submission = reddit.get_submission(submission_id = submission_id)
+            post_mentions[submission_id] = _get_post_mentions(submission)
+            if checkpoint is None:
+                checkpoint = tools.ScanCheckpoint(submission.created_utc)
+                _expand_into_checkpoint(submission, checkpoint)
+        mention_search_posts.merge_new_comments(checkpoint, [item])
+
+    checkpoints.pop(submission_id, None)
+    checkpoints[submission_id] = checkpoint  # most recently scanned last
+    post = post_mentions[submission_id]
+    return PostWithMentions(submission_id, mention_search_posts.combine_mentions(post.mentions_list, checkpoint),
+                            post.author_name, post.title)
+
+
+def _get_post_mentions(submission: praw.objects.Submission) -> PostWithMentions:
+    """Finds mentions in a submission's title and selftext, and keeps its author and title.
+
+    :param submission: a praw submission object
+    :type submission: praw.objects.Submission
+    :return: the submission's id, author, title, and mentions in its title and selftext
+    :rtype: PostWithMentions
+    """
+    return PostWithMentions(submission.id, mention_search_posts.get_post_mentions(submission),
+                            mention_search_posts.get_author_name(submission), submission.title)
+
+
+def _run_scanner(reddit: praw.Reddit, events: queue.Queue, posts: queue.Queue,
+                 checkpoints: Dict[str, tools.ScanCheckpoint], checkpoints_lock: threading.Lock) -> None:
+    """Scans each new submission and comment, and queues posts whose mentions changed to be commented on. Runs in its
+    own thread.
+
+    :param reddit: authorized reddit praw object
+    :type reddit: praw.Reddit
+    :param events: queue of new submissions and comments
+    :type events: queue.Queue
+    :param posts: queue to put PostWithMentions in
+    :type posts: queue.Queue
+    :param checkpoints: dict of <submission id, ScanCheckpoint>
+    :type checkpoints: dict
+    :param checkpoints_lock: held while checkpoints is being changed or saved
+    :type checkpoints_lock: threading.Lock
+    """
+    post_mentions = {}
+    last_queued: Dict[str, List[str]] = {}
+    last_save = time.monotonic()
+
+    while True:
+        item = events.get()
+        try:
+            with checkpoints_lock:
+                post_with_mentions = _scan_event(reddit, item, checkpoints, post_mentions)
+        except _reddit_errors as error:
+            print(f'could not scan {item.fullname}: {error}')
+            continue
+        except Exception:
+            print(f'could not scan {item.fullname}, skipping it:')
+            traceback.print_exc()
+            continue
+
+        post_id = post_with_mentions.post_id
+        if post_with_mentions.mentions_list and post_with_mentions.mentions_list != last_queued.get(post_id):
+            last_queued[post_id] = post_with_mentions.mentions_list
+            posts.put(post_with_mentions)  # waits while the queue is full
+
+        if time.monotonic() - last_save > CHECKPOINT_SAVE_SECONDS:
+            try:
+                # forget the same submissions as the checkpoints, so a long-running daemon doesn't keep every one
+                for submission_id in _save_checkpoints(checkpoints, checkpoints_lock):
+                    post_mentions.pop(submission_id, None)
+                    last_queued.pop(submission_id, None)
+            except Exception:
+                print('could not save scan checkpoints:')
+                traceback.print_exc()
+            last_save = time.monotonic()
+
+
+def _run_poster(reddit: praw.Reddit, posts: queue.Queue, course_index: db_core.CourseIndex,
+                stop: threading.Event) -> None:
+    """Posts or edits a comment on each post queued by the scanner. Runs in its own thread.
+    Edits wait in a WriteScheduler, so a busy thread's comment is edited once for a burst of new mentions. When stop
+    is set, the posts still queued are handled and every waiting write is made before the posts with comments are
+    saved and the thread ends.
+
+    :param reddit: authorized reddit praw object
+    :type reddit: praw.Reddit
+    :param posts: queue of PostWithMentions
+    :type posts: queue.Queue
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
+    :param stop: set when the daemon is stopping
+    :type stop: threading.Event
+    """
+    existing_posts_with_comments = tools.load_posts_with_comments()
+    scheduler = WriteScheduler(reddit)
+    num_changed = 0
+    num_left = None  # once stopping, how many of the posts queued when it stopped are left to handle
+    while True:
+        stopping = stop.is_set()
+        if stopping and num_left is None:
+            # the scanner keeps queueing until the daemon exits, so only handle what was queued by now
+            num_left = posts.qsize()
+
+        post_with_mentions = None
+        try:
+            if not stopping:
+                # wake up when the next waiting write is due, if no post is queued before then
+                wait = scheduler.seconds_until_due()
+                post_with_mentions = posts.get(timeout = POSTER_WAKE_SECONDS if wait is None
+                                               else min(wait, POSTER_WAKE_SECONDS))
+            elif num_left > 0:
+                num_left -= 1
+                post_with_mentions = posts.get_nowait()
+        except queue.Empty:
+            pass
+
+        if stopping and post_with_mentions is None and not scheduler:
+            break
+
+        try:
+            if post_with_mentions is not None and _post_comment_helper(
+                    course_index, existing_posts_with_comments, post_with_mentions, reddit, scheduler = scheduler):
+                num_changed += 1
+            # once stopping, make edits now instead of waiting for their window
+            scheduler.run_due(flush = stopping)
+        except _reddit_errors as error:
+            print(f'could not post or edit a comment: {error}')
+        except Exception:
+            print('could not post or edit a comment:')
+            traceback.print_exc()
+
+        # every change is already in the posting journal, this just keeps the journal short
+        if num_changed >= CHECKPOINT_EVERY:
+            try:
+                tools.save_posts_with_comments(existing_posts_with_comments)
+                num_changed = 0
+            except OSError as error:
+                print(f'could not save posts with comments: {error}')
+
+    tools.save_posts_with_comments(existing_posts_with_comments)
+    print(f'{scheduler.num_merged} writes replaced by newer ones before being made.')
+
+
+def _save_checkpoints(checkpoints: Dict[str, tools.ScanCheckpoint], checkpoints_lock: threading.Lock) -> List[str]:
+    """Saves the scan checkpoints, dropping the oldest past mention_search_posts.CHECKPOINTS_KEPT.
+
+    :param checkpoints: dict of <submission id, ScanCheckpoint>
+    :type checkpoints: dict
+    :param checkpoints_lock: held while checkpoints is being changed or saved
+    :type checkpoints_lock: threading.Lock
+    :return: ids of the submissions whose checkpoint was dropped
+    :rtype: list
+    """
+    dropped = []
+    with checkpoints_lock:
+        while len(checkpoints) > mention_search_posts.CHECKPOINTS_KEPT:
+            submission_id = next(iter(checkpoints))
+            del checkpoints[submission_id]
+            dropped.append(submission_id)
+        tools.save_scan_checkpoints(checkpoints)
+    return dropped
+
+
+def run(reddit: praw.Reddit, course_index: Optional[db_core.CourseIndex] = None) -> None:
+    """Watches /r/UCSC and replies to mentions until interrupted with Ctrl+C.
+
+    :param reddit: authorized reddit praw object, used by the poster. The streams and the scanner each log in again
+        with its handler.
+    :type reddit: praw.Reddit
+    :param course_index: looks up the course of each mention. Loads the database if None.
+    :type course_index: db_core.CourseIndex
+    """
+    if course_index is None:
+        course_index = db_core.CourseIndex(db_core.open_database())
+    submissions_reddit, comments_reddit, scanner_reddit = (tools.auth_reddit(reddit.handler) for _ in range(3))
+
+    events = queue.Queue(maxsize = EVENT_QUEUE_SIZE)
+    posts = queue.Queue(maxsize = POST_QUEUE_SIZE)
+    checkpoints = tools.load_scan_checkpoints()
+    checkpoints_lock = threading.Lock()
+    stop = threading.Event()
+
+    poster = threading.Thread(target = _run_poster, name = 'poster', args = (reddit, posts, course_index, stop))
+    threads = [
+        threading.Thread(target = _run_stream, name = 'submissions', args = (
+            'submission',
+            lambda: praw.helpers.submission_stream(submissions_reddit, 'ucsc', limit = STREAM_LIMIT, verbosity = 0),
+            events)),
+        threading.Thread(target = _run_stream, name = 'comments', args = (
+            'comment',
+            lambda: praw.helpers.comment_stream(comments_reddit, 'ucsc', limit = STREAM_LIMIT, verbosity = 0),
+            events)),
+        threading.Thread(target = _run_scanner, name = 'scanner',
+                         args = (scanner_reddit, events, posts, checkpoints, checkpoints_lock)),
+        poster]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    print('Watching /r/UCSC. Press Ctrl+C to stop.')
+    try:
+        while all(thread.is_alive() for thread in threads):
+            time.sleep(1)
+        print('A daemon thread died, stopping.')
+    except KeyboardInterrupt:
+        pass
+
+    # the checkpoints have the newest mentions, so comments must get them too instead of waiting for the next event
+    stop.set()
+    if poster.is_alive():
+        print('Making the comments and edits still waiting. Press Ctrl+C again to drop them.')
+        try:
+            poster.join()
+        except KeyboardInterrupt:
+            pass
+    _save_checkpoints(checkpoints, checkpoints_lock)
+
+
+if __name__ == "__main__":
+    run(tools.auth_reddit())
@@ -2,24 +2,61 @@
 Given a string of a department and course number, pulls information about the course from the registrar.
 """
 
-from typing import Optional
+from __future__ import annotations  # Course and Department are referred to before they are defined
+from typing import Optional, List, Dict, Tuple
 import requests  # pulls registrar pages
+from requests.adapters import HTTPAdapter  # connection pool size
 import re  # regular expressions
-from bs4 import BeautifulSoup  # html parser
+from bs4 import BeautifulSoup, SoupStrainer  # html parser
 import pickle  # serializer
 import os.path  # check if file exists, get file size
 from datetime import datetime  # added to output logs
 import sys  # print without newline
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor  # fetches and parses pages in parallel
+import contextlib  # captures parse logs in worker processes
+import io
+from rate_limit import HostRateLimiter
+import db_snapshot  # saved copies of registrar pages
+import mention_parse  # normalizes mentions to look courses up by
+import departments
 
 DEBUG = False
 
-_all_departments = [
-    "acen", "aplx", "ams", "art", "artg", "astr", "bioc", "mcdb", "eeb", "bme", "chem", "chin", "clni", "clte", "cmmu",
-    "cmpm", "cmpe", "cmps", "cowl", "cres", "crwn", "danm", "eart", "educ", "ee", "envs", "fmst", "film", "fren",
-    "game", "gree", "hebr", "his", "hisc", "ital", "japn", "jwst", "krsg", "laad", "latn", "lals", "lgst", "ling",
-    "math", "merr", "metx", "musc", "oaks", "ocea", "phil", "phye", "phys", "poli", "port", "punj", "russ", "scic",
-    "socd", "socy", "span", "sphs", "stev", "tim", "thea", "ucdc", "writ", "yidd", 'prtr', 'anth', 'psyc', 'havc',
-    'clei', 'econ', 'germ']
+# how many department pages to download at the same time, and how many requests per second to send the registrar
+FETCH_WORKERS = 16
+FETCH_REQUESTS_PER_SECOND = 20
+
+# format open_database() reads: 'mmap' for the store written by db_mmap.py, 'sqlite' for db_sqlite.py, or 'pickle'
+DATABASE_FORMAT = 'mmap'
+
+# how many processes parse pages at the same time. 1 parses every page in this process.
+PARSE_WORKERS = 1
+
+# read registrar pages from the snapshot saved by earlier builds instead of downloading them
+OFFLINE = False
+
+# tree builder BeautifulSoup uses: 'html.parser' is built in, 'lxml' is faster but needs the lxml package
+PARSER = 'html.parser'
+
+# only build the part of the page inside <div class="main-content">, which is the only part the parsing code looks at
+PARSE_ONLY_MAIN_CONTENT = True
+
+_registrar_url = "http://registrar.ucsc.edu/catalog/programs-courses/course-descriptions/"
+
+# one keep-alive session shared by every fetch, with a connection pool big enough for all the workers
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_maxsize = FETCH_WORKERS))
+_session.mount('https://', HTTPAdapter(pool_maxsize = FETCH_WORKERS))
+
+# pages saved by builds, and read back when OFFLINE. Use _get_snapshot().
+_snapshot = None
+
+# registrar urls which don't match the course dept code, and the page of every department besides lit
+_renamed_departments = departments.renamed_departments
+_all_departments = departments.all_departments
+
+# used in get_soup_object() when PARSE_ONLY_MAIN_CONTENT is set
+_main_content_strainer = SoupStrainer('div', class_ = 'main-content')
 
 # used in has_course_number() below
 regex_course_num = re.compile("[0-9]+[A-Za-z]?\.")
@@ -28,15 +65,52 @@ regex_course_num = re.compile("[0-9]+[A-Za-z]?\.")
 class CourseDatabase:
     """Holds a bunch of Departments, each of which hold a bunch of Courses."""
 
+    __slots__ = ('depts', 'num_courses')
+
     def __init__(self):
         self.depts = {}
         self.num_courses = 0
 
+    def __getstate__(self) -> tuple:
+        return self.depts, self.num_courses
+
+    def __setstate__(self, state) -> None:
+        # pickles from before __slots__ hold a dict of attributes
+        if isinstance(state, dict):
+            state = state['depts'], state['num_courses']
+        self.depts, self.num_courses = state
+
+    def dept_codes(self) -> List[str]:
+        """Returns the department code of every course, without duplicates.
+
+        :return: department codes, like 'cmps'
+        :rtype: list
+        """
+        return list(dict.fromkeys(course.dept for dept in self.depts.values() for course in dept.courses.values()))
+
+    def get_course(self, dept: str, number: str) -> Optional[Course]:
+        """Looks up a course. The other database formats have this method too.
+
+        :param dept: department code, like 'cmps'
+        :type dept: str
+        :param number: padded course number, like '012B'
+        :type number: str
+        :return: the course, or None if there's no such course
+        :rtype: Course, None
+        """
+        try:
+            return self.depts[dept].courses[number]
+        except KeyError:
+            return None
+
     def add_dept(self, new_dept: Department) -> None:
-        """Add a department to the course database.
+        """Add a department to the course database, replacing any department with the same name.
         :param new_dept: Department object to add
         :type new_dept: Department
         """
+        old_dept = self.depts.get(new_dept.name)
+        if old_dept is not None:
+            self.num_courses -= len(old_dept.courses)
         self.depts[new_dept.name] = new_dept
         self.num_courses += len(new_dept.courses)
 
@@ -50,9 +124,22 @@ class CourseDatabase:
 class Department:
     """Holds a bunch of Courses."""
 
+    __slots__ = ('courses', 'name')
+
     def __init__(self, name):
         self.courses = {}
-        self.name = name
+        self.name = sys.intern(name)
+
+    def __getstate__(self) -> tuple:
+        return self.name, tuple(self.courses.values())
+
+    def __setstate__(self, state) -> None:
+        # pickles from before __slots__ hold a dict of attributes
+        if isinstance(state, dict):
+            state = state['name'], tuple(state['courses'].values())
+        name, courses = state
+        self.name = sys.intern(name)
+        self.courses = {course.number: course for course in courses}
 
     def add_course(self, new_course: Course) -> None:
         """Adds a course to the department.
@@ -87,17 +174,106 @@ def pad_course_num(number: str) -> str:
 class Course:
     """Holds course name and description."""
 
+    __slots__ = ('dept', 'number', 'name', 'description', '_markdown')
+
     def __init__(self, dept_name: str, number: str, name: str, description: str):
-        self.dept = dept_name
-        self.number = pad_course_num(number)
+        # interned so every course in a department, and every course with the same number, shares one string
+        self.dept = sys.intern(dept_name)
+        self.number = sys.intern(pad_course_num(number))
         self.name = name
         self.description = description
+        self._markdown = None
+
+    def __getstate__(self) -> tuple:
+        return self.dept, self.number, self.name, self.description
+
+    def __setstate__(self, state) -> None:
+        # pickles from before __slots__ hold a dict of attributes
+        if isinstance(state, dict):
+            state = state['dept'], state['number'], state['name'], state['description']
+        dept, number, self.name, self.description = state
+        self.dept = sys.intern(dept)
+        self.number = sys.intern(number)
+        self._markdown = None
+
+    @property
+    def markdown(self) -> str:
+        """Markdown of the course for reddit comments. Rendered the first time it's needed, then kept, but not
+        pickled. Example:
+        '**ECON 1: Into to Stuff**
+        >We learn about econ and things.'
+
+        :return: string of markdown of the course
+        :rtype: str
+        """
+        if self._markdown is None:
+            num_leading_zeroes_stripped = self.number.lstrip('0')
+            self._markdown = f'**{self.dept.upper()} {num_leading_zeroes_stripped}: {self.name}**\n' + \
+                             f'>{self.description}\n\n'
+        return self._markdown
 
     def __str__(self) -> str:
         # return "{} {}: {}".format(self.dept, self.number, self.name)
         return f'"{self.name}"'
 
 
+class CourseIndex:
+    """Looks up courses by mention, like 'CS 12B' or 'cmps 12b', in any database format."""
+
+    __slots__ = ('_db', '_courses')
+
+    def __init__(self, db):
+        """
+        :param db: database to look up courses in
+        :type db: CourseDatabase, db_mmap.MappedCourseStore, db_sqlite.SqliteCourseDatabase
+        """
+        self._db = db
+        self._courses: Dict[str, Optional[Course]] = {}  # <normalized mention, course>
+
+        # every course of a CourseDatabase is in memory already, so index them all now. The other formats read
+        # courses from disk, so those are looked up the first time they are mentioned, then remembered.
+        if isinstance(db, CourseDatabase):
+            for dept in db.depts.values():
+                for course in dept.courses.values():
+                    self._courses[mention_parse.normalize_mention(course.dept + ' ' + course.number)] = course
+
+    def get(self, mention: str) -> Optional[Course]:
+        """Looks up the course a mention is of.
+
+        :param mention: mention of a course, like 'econ 1'
+        :type mention: str
+        :return: the course, or None if there's no such course
+        :rtype: Course, None
+        """
+        key = mention_parse.normalize_mention(mention)
+        try:
+            return self._courses[key]
+        except KeyError:
+            if isinstance(self._db, CourseDatabase):
+                return None
+
+        dept, number = key.split(' ')
+        if not number[:1].isdigit():
+            # a number of only zeroes, like in 'cs 0', is empty once normalized. No course has a number like that.
+            course = None
+        else:
+            course = self._db.get_course(dept, pad_course_num(number.upper()))
+        self._courses[key] = course
+        return course
+
+
+class PageInfo:
+    """What we know about a registrar page from the last time it was downloaded."""
+
+    def __init__(self, etag: str = None, last_modified: str = None, sha256: str = None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.sha256 = sha256
+
+    def __str__(self) -> str:
+        return f'page info: etag {self.etag}, last modified {self.last_modified}, sha256 {self.sha256}'
+
+
 def has_course_number(num_string: str) -> bool:
     """Whether a string has a course number in it.
 
@@ -109,22 +285,142 @@ def has_course_number(num_string: str) -> bool:
     return regex_course_num.match(num_string) is not None
 
 
-def get_soup_object(dept_name: str) -> BeautifulSoup:
-    """Requests a page from the registrar and returns a BeautifulSoup object of it.
+def _get_snapshot() -> db_snapshot.Snapshot:
+    """Returns the snapshot of registrar pages, reading its index the first time.
+
+    :return: the snapshot
+    :rtype: db_snapshot.Snapshot
+    """
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = db_snapshot.Snapshot()
+    return _snapshot
+
+
+def _save_snapshot(pages: Dict[str, Optional[str]]) -> None:
+    """Adds downloaded pages to the snapshot.
+
+    :param pages: dict of <page name, html>, where html is None if the page was not downloaded
+    :type pages: dict
+    """
+    snapshot = _get_snapshot()
+    for page_name, html in pages.items():
+        if html is not None:
+            snapshot.add(page_name, html)
+    snapshot.save_index()
+
+
+def get_page_html(dept_name: str, rate_limiter: HostRateLimiter = None, page_info: PageInfo = None) -> Optional[str]:
+    """Requests a page from the registrar and returns its html, or reads it from the snapshot if OFFLINE.
+    If page_info is given, the request is conditional and page_info is updated from the response headers.
 
     :param dept_name: string like 'cmps'
     :type dept_name: str
+    :param rate_limiter: if given, waits for it before sending the request
+    :type rate_limiter: HostRateLimiter
+    :param page_info: ETag and Last-Modified from the last time the page was downloaded
+    :type page_info: PageInfo
+    :return: html of the department's page, or None if it has not changed since page_info was saved
+    :rtype: str, None
+    """
+    if OFFLINE:
+        return _get_snapshot().get(dept_name)
+
+    url = _registrar_url + dept_name + ".html"
+
+    headers = {}
+    if page_info is not None:
+        if page_info.etag is not None:
+            headers['If-None-Match'] = page_info.etag
+        if page_info.last_modified is not None:
+            headers['If-Modified-Since'] = page_info.last_modified
+
+    if rate_limiter is not None:
+        rate_limiter.acquire(url)
+
+    request_result = _session.get(url, headers = headers)
+    if request_result.status_code == 304:
+        return None
+    request_result.raise_for_status()
+
+    if page_info is not None:
+        page_info.etag = request_result.headers.get('ETag')
+        page_info.last_modified = request_result.headers.get('Last-Modified')
+
+    return request_result.text
+
+
+def get_soup_object(dept_name: str, html: str = None) -> BeautifulSoup:
+    """Returns a BeautifulSoup object of a department's page, requesting it from the registrar if html isn't given.
+    The page is parsed with PARSER, and only the main content is built if PARSE_ONLY_MAIN_CONTENT is set.
+
+    :param dept_name: string like 'cmps'
+    :type dept_name: str
+    :param html: already downloaded html of the page
+    :type html: str
     :return: BeautifulSoup object of the department's courses
     :rtype: BeautifulSoup
     """
-    url = "http://registrar.ucsc.edu/catalog/programs-courses/course-descriptions/" + dept_name + ".html"
+    if html is None:
+        html = get_page_html(dept_name)
+    parse_only = _main_content_strainer if PARSE_ONLY_MAIN_CONTENT else None
+    return BeautifulSoup(html, PARSER, parse_only = parse_only)
+
+
+def _fetch_pages(page_names: List[str], num_workers: int = FETCH_WORKERS,
+                 requests_per_second: float = FETCH_REQUESTS_PER_SECOND, page_infos: Dict[str, PageInfo] = None,
+                 failures: Dict[str, Exception] = None) -> Dict[str, Optional[str]]:
+    """Downloads registrar pages in parallel.
+
+    :param page_names: names of the pages to get, like ['cmps', 'lit']
+    :type page_names: list
+    :param num_workers: how many pages to download at the same time
+    :type num_workers: int
+    :param requests_per_second: most requests per second to send to the registrar
+    :type requests_per_second: float
+    :param page_infos: dict of <page name, PageInfo>. Pages in it are requested conditionally, and it gets updated.
+    :type page_infos: dict
+    :param failures: if given, pages which can't be downloaded are put in it and left out of the result instead of
+        raising an exception
+    :type failures: dict
+    :return: dict of <page name, html>, where html is None if the page has not changed
+    :rtype: dict
+    """
+    if page_infos is None:
+        page_infos = {}
+    rate_limiter = HostRateLimiter(requests_per_second, capacity = num_workers)
+    if OFFLINE:
+        _get_snapshot()  # read the index before the workers need it
+
+    def fetch(page_name: str) -> Optional[str]:
+        try:
+            return get_page_html(page_name, rate_limiter, page_infos.get(page_name))
+        except (requests.RequestException, KeyError) as error:  # KeyError if OFFLINE and the page was never saved
+            if failures is None:
+                raise
+            failures[page_name] = error
+            return None
+
+    with ThreadPoolExecutor(max_workers = num_workers) as executor:
+        pages = dict(zip(page_names, executor.map(fetch, page_names)))
+
+    return {name: html for name, html in pages.items() if failures is None or name not in failures}
 
-    request_result = requests.get(url)
-    request_result.raise_for_status()
-    return BeautifulSoup(request_result.text, 'html.parser')
 
+def _page_dept_names(page_name: str) -> List[str]:
+    """Names of the departments built from a registrar page.
 
-def get_course(dept_name: str, num_tag) -> Optional[Course]:
+    :param page_name: name of the page, like 'cmps', 'eeb', or 'lit'
+    :type page_name: str
+    :return: department codes, like ['cmps'], ['bioe'], or all the lit sub-departments
+    :rtype: list
+    """
+    if page_name == 'lit':
+        return list(extras.lit_department_codes.values())
+    return [_renamed_departments.get(page_name, page_name)]
+
+
+def get_course(dept_name: str, num_tag, page_index = None) -> Optional[Course]:
     """Builds and returns a Course object from the number specified.
     If the <strong> tag has more than just the number in it, use get_course_all_in_one().
 
@@ -132,6 +428,8 @@ def get_course(dept_name: str, num_tag) -> Optional[Course]:
     :type dept_name: str
     :param num_tag: tag of a course number, like <strong>21.</strong>
     :type num_tag: Tag
+    :param page_index: positions of the page's <strong> tags, so the special case checks don't search the page
+    :type page_index: db_extra.PageIndex
     :return: Course object of the specified course, or None if the course has sub-numbers
     :rtype: Course, None
     """
@@ -145,7 +443,7 @@ def get_course(dept_name: str, num_tag) -> Optional[Course]:
             print('>>>>>>>>>> havc 152 special case')
         return extras.get_course_all_in_one('havc', num_tag)
 
-    if extras.is_last_course_in_p(num_tag) and extras.is_next_p_indented(num_tag) and not \
+    if extras.is_last_course_in_p(num_tag, page_index) and extras.is_next_p_indented(num_tag) and not \
             extras.in_indented_paragraph(num_tag):
         if DEBUG:
             print(f'   SKIPPING num_tag "{num_tag.text}"')
@@ -166,7 +464,7 @@ def get_course(dept_name: str, num_tag) -> Optional[Course]:
     descr_str = descr_tag[2:]
 
     if dept_name == 'lit':
-        real_dept_name = extras.get_real_lit_dept(num_tag).replace("\ufeff", "")  # remove byte order mark
+        real_dept_name = extras.get_real_lit_dept(num_tag, page_index).replace("\ufeff", "")  # remove byte order mark
         if DEBUG:
             print(f'   real name is "{real_dept_name}"')
 
@@ -179,32 +477,30 @@ def get_course(dept_name: str, num_tag) -> Optional[Course]:
         return Course(dept_name, course_num, course_name, descr_str)
 
 
-def _get_department_object(dept_name: str) -> Department:
+def _get_department_object(dept_name: str, html: str = None) -> Department:
     """Builds and returns a Department object with all courses.
 
     :param dept_name: name of the department to get classes for
     :type dept_name: str
+    :param html: already downloaded html of the department's page. If None, the page is requested.
+    :type html: str
     :return: Department object of all the courses in the department
     :rtype: Department
     """
     # if DEBUG:
     sys.stdout.write(f'Building department "{dept_name}"')
 
-    soup = get_soup_object(dept_name)
-
-    # registrar url has EEB, courses use dept code BIOE
-    if dept_name == 'eeb':
-        dept_name = 'bioe'
-        sys.stdout.write(f"changed name to {dept_name}...")
+    soup = get_soup_object(dept_name, html)
 
-    # registrar url has MCDB, courses use dept code BIOL
-    if dept_name == 'mcdb':
-        dept_name = 'biol'
+    # registrar url has EEB and MCDB, courses use dept codes BIOE and BIOL
+    if dept_name in _renamed_departments:
+        dept_name = _renamed_departments[dept_name]
         sys.stdout.write(f"changed name to {dept_name}...")
 
     new_dept = Department(dept_name)
 
     every_strong_tag = soup.select("div.main-content strong")
+    page_index = extras.PageIndex(every_strong_tag)
     strong_tags_with_course_nums = []
 
     for tag in every_strong_tag:
@@ -215,7 +511,7 @@ def _get_department_object(dept_name: str) -> Department:
         if dept_name == 'clei':
             new_dept.add_course(extras.get_course_all_in_one('clei', num_tag))
         else:
-            new_dept.add_course(get_course(dept_name, num_tag))
+            new_dept.add_course(get_course(dept_name, num_tag, page_index))
 
     if dept_name == 'germ' or dept_name == 'econ':
         new_dept.add_course(extras.get_first_course_no_bold(dept_name, every_strong_tag[0]))
@@ -225,9 +521,111 @@ def _get_department_object(dept_name: str) -> Department:
     return new_dept
 
 
-def _build_database() -> CourseDatabase:
-    """Builds and returns a CourseDatabase object.
+def _parse_page(page_name: str, html: str) -> List[Department]:
+    """Builds the departments on one registrar page.
+
+    :param page_name: name of the page, like 'cmps' or 'lit'
+    :type page_name: str
+    :param html: html of the page
+    :type html: str
+    :return: list of Department objects, which has more than one only for the lit page
+    :rtype: list
+    """
+    if page_name == 'lit':
+        return extras.get_lit_depts(html)
+    return [_get_department_object(page_name, html)]
+
 
+# a department as plain data, to send between processes: (name, [(dept, number, name, description), ...])
+_DepartmentRows = Tuple[str, List[Tuple[str, str, str, str]]]
+
+
+def _parse_page_job(page_name: str, html: str) -> Tuple[str, List[_DepartmentRows]]:
+    """Parses one page in a worker process.
+    Departments are returned as plain tuples so the main process builds them from its own Course and Department
+    classes, no matter how the worker imported db_core.
+
+    :param page_name: name of the page, like 'cmps' or 'lit'
+    :type page_name: str
+    :param html: html of the page
+    :type html: str
+    :return: what parsing printed, and the page's departments as tuples
+    :rtype: tuple
+    """
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        depts = _parse_page(page_name, html)
+
+    dept_rows = []
+    for dept in depts:
+        dept_rows.append((dept.name, [(c.dept, c.number, c.name, c.description) for c in dept.courses.values()]))
+    return log.getvalue(), dept_rows
+
+
+def _parse_pages(pages: Dict[str, str], num_workers: int = PARSE_WORKERS,
+                 failures: Dict[str, Exception] = None) -> Dict[str, List[Department]]:
+    """Parses registrar pages, in a pool of worker processes if num_workers is more than 1.
+
+    :param pages: dict of <page name, html>
+    :type pages: dict
+    :param num_workers: how many pages to parse at the same time
+    :type num_workers: int
+    :param failures: if given, pages which can't be parsed are put in it and left out of the result instead of
+        raising an exception
+    :type failures: dict
+    :return: dict of <page name, list of Department objects>
+    :rtype: dict
+    """
+    parsed = {}
+
+    if num_workers <= 1:
+        for page_name, html in pages.items():
+            try:
+                parsed[page_name] = _parse_page(page_name, html)
+            except Exception as error:
+                if failures is None:
+                    raise
+                failures[page_name] = error
+        return parsed
+
+    with ProcessPoolExecutor(max_workers = num_workers) as executor:
+        # biggest pages first, so a big page started last doesn't hold up the end of the build
+        futures = {page_name: executor.submit(_parse_page_job, page_name, pages[page_name])
+                   for page_name in sorted(pages, key = lambda name: len(pages[name]), reverse = True)}
+
+        for page_name in pages:
+            try:
+                log, dept_rows = futures[page_name].result()
+            except Exception as error:
+                if failures is None:
+                    raise
+                failures[page_name] = error
+                continue
+
+            sys.stdout.write(log)
+            parsed[page_name] = []
+            for dept_name, course_rows in dept_rows:
+                new_dept = Department(dept_name)
+                for course_row in course_rows:
+                    new_dept.add_course(Course(*course_row))
+                parsed[page_name].append(new_dept)
+
+    return parsed
+
+
+def _build_database(num_workers: int = FETCH_WORKERS, requests_per_second: float = FETCH_REQUESTS_PER_SECOND,
+                    page_infos: Dict[str, PageInfo] = None, parse_workers: int = None) -> CourseDatabase:
+    """Builds and returns a CourseDatabase object.
+    All the pages are downloaded in parallel first, then parsed by parse_workers processes.
+
+    :param num_workers: how many pages to download at the same time
+    :type num_workers: int
+    :param requests_per_second: most requests per second to send to the registrar
+    :type requests_per_second: float
+    :param parse_workers: how many pages to parse at the same time. Defaults to PARSE_WORKERS.
+    :type parse_workers: int
+    :param page_infos: if given, gets filled with a PageInfo for every page
+    :type page_infos: dict
     :return: CourseDatabase object with all Departments
     :rtype: CourseDatabase
     """
@@ -235,30 +633,162 @@ def _build_database() -> CourseDatabase:
     print('----------------------------------')
     db = CourseDatabase()
 
-    for current_dept in _all_departments:
-        db.add_dept(_get_department_object(current_dept))
+    page_names = _all_departments + ['lit']
+    if page_infos is None:
+        page_infos = {}
+    for page_name in page_names:
+        page_infos[page_name] = PageInfo()
+
+    pages = _fetch_pages(page_names, num_workers, requests_per_second, page_infos)
+    if OFFLINE:
+        print(f'Read {len(pages)} pages from the snapshot.')
+    else:
+        print(f'Downloaded {len(pages)} pages with {num_workers} workers.')
+        _save_snapshot(pages)
+
+    parsed = _parse_pages(pages, PARSE_WORKERS if parse_workers is None else parse_workers)
+    for page_name in page_names:
+        for dept in parsed[page_name]:
+            db.add_dept(dept)
+        page_infos[page_name].sha256 = db_snapshot.hash_html(pages[page_name])
 
-    for lit_dept in extras.get_lit_depts():
-        db.add_dept(lit_dept)
     return db
 
 
+def _update_database(db: CourseDatabase, page_infos: Dict[str, PageInfo], num_workers: int = FETCH_WORKERS,
+                     requests_per_second: float = FETCH_REQUESTS_PER_SECOND, parse_workers: int = None) -> Dict[str, str]:
+    """Updates a CourseDatabase in place, parsing again only the pages which changed since the last build.
+    A page has not changed if the registrar answers 304 or if the hash of its html is the same as last time.
+    If a page can't be downloaded or parsed, its departments are left as they were.
+
+    :param db: database from the last build. Gets updated.
+    :type db: CourseDatabase
+    :param page_infos: dict of <page name, PageInfo> from the last build. Gets updated.
+    :type page_infos: dict
+    :param num_workers: how many pages to download at the same time
+    :type num_workers: int
+    :param requests_per_second: most requests per second to send to the registrar
+    :type requests_per_second: float
+    :param parse_workers: how many pages to parse at the same time. Defaults to PARSE_WORKERS.
+    :type parse_workers: int
+    :return: dict of <department name, 'changed' or 'unchanged' or 'failed'>
+    :rtype: dict
+    """
+    print(f'Starting the incremental database update on {datetime.now()}.')
+    print('----------------------------------')
+
+    page_names = _all_departments + ['lit']
+    for page_name in page_names:
+        # only trust a 304 or a matching hash if the database has the page's departments to keep
+        if page_name not in page_infos or not all(d in db.depts for d in _page_dept_names(page_name)):
+            page_infos[page_name] = PageInfo()
+
+    failures = {}
+    pages = _fetch_pages(page_names, num_workers, requests_per_second, page_infos, failures)
+    if not OFFLINE:
+        _save_snapshot(pages)
+
+    changed_pages = {name: html for name, html in pages.items()
+                     if html is not None and db_snapshot.hash_html(html) != page_infos[name].sha256}
+    parsed = _parse_pages(changed_pages, PARSE_WORKERS if parse_workers is None else parse_workers, failures)
+
+    statuses = {}
+    for page_name in page_names:
+        status = 'unchanged'
+
+        if page_name in failures:
+            status = 'failed'
+        elif page_name in parsed:
+            for dept in parsed[page_name]:
+                db.add_dept(dept)
+            page_infos[page_name].sha256 = db_snapshot.hash_html(changed_pages[page_name])
+            status = 'changed'
+
+        if status == 'failed':
+            # forget about the page so it gets downloaded and parsed again next time
+            page_infos[page_name] = PageInfo()
+
+        for dept_name in _page_dept_names(page_name):
+            statuses[dept_name] = status
+
+    print('----------------------------------')
+    for dept_name, status in sorted(statuses.items()):
+        print(f'{dept_name.ljust(4)}: {status}')
+    for page_name, error in failures.items():
+        print(f'page "{page_name}" failed: {error!r}')
+    counts = [f'{list(statuses.values()).count(s)} {s}' for s in ('changed', 'unchanged', 'failed')]
+    print(f'{len(statuses)} departments: ' + ', '.join(counts) + '.')
+
+    return statuses
+
+
 _database_pickle_path = os.path.join(os.path.dirname(__file__), r'pickle\course_database.pickle')
+_page_infos_pickle_path = os.path.join(os.path.dirname(__file__), 'pickle', 'page_infos.pickle')
 
 
-def _save_database() -> None:
-    """Builds and saves a new database to a file on disk."""
-    if os.path.isfile(_database_pickle_path):
-        print('save_database(): database already exists. Use load_database() instead.')
-        return
+def _load_page_infos() -> Dict[str, PageInfo]:
+    """Reads from disk the PageInfo of every registrar page from the last build.
 
-    db = _build_database()
+    :return: dict of <page name, PageInfo>
+    :rtype: dict
+    """
+    if not os.path.isfile(_page_infos_pickle_path):
+        return dict()
+
+    with open(_page_infos_pickle_path, 'rb') as file:
+        page_infos = pickle.load(file)
+    file.close()
+    return page_infos
+
+
+def _save_database(incremental: bool = False) -> None:
+    """Builds and saves a new database to a file on disk.
+
+    :param incremental: if the database already exists, update it by parsing only the pages which changed
+    :type incremental: bool
+    """
+    import db_mmap
+    import db_sqlite
+
+    changed_depts = None  # None means every department is new
+    if os.path.isfile(_database_pickle_path):
+        if not incremental:
+            print('save_database(): database already exists. Use load_database() or --incremental instead.')
+            return
+        db = load_database()
+        page_infos = _load_page_infos()
+        statuses = _update_database(db, page_infos)
+        changed_depts = [db.depts[name] for name, status in statuses.items() if status == 'changed']
+    else:
+        page_infos = {}
+        db = _build_database(page_infos = page_infos)
 
     with open(_database_pickle_path, 'wb') as file:
         pickle.dump(db, file)
     file.close()
+
+    # only save page infos once the pages they describe are in the saved database
+    with open(_page_infos_pickle_path, 'wb') as file:
+        pickle.dump(page_infos, file)
+    file.close()
+
+    db_mmap.write_store(db)
+
+    # an update only needs the changed departments written, if the SQLite database is already there. A full build
+    # replaces every course, so departments the registrar dropped don't stay in it.
+    full_write = changed_depts is None or not os.path.isfile(db_sqlite.sqlite_path)
+    sqlite_db = db_sqlite.SqliteCourseDatabase()  # creates the file if it isn't there
+    if full_write:
+        changed_depts = list(db.depts.values())
+        sqlite_db.write_database(db)
+    else:
+        sqlite_db.upsert_depts(changed_depts)
+    sqlite_db.close()
+
     print('----------------------------------')
-    print(f'Wrote {os.path.getsize(_database_pickle_path):,} bytes to path "{_database_pickle_path}".\n')
+    print(f'Wrote {os.path.getsize(_database_pickle_path):,} bytes to path "{_database_pickle_path}".')
+    print(f'Wrote {os.path.getsize(db_mmap.store_path):,} bytes to path "{db_mmap.store_path}".')
+    print(f'Wrote {len(changed_depts)} departments to path "{db_sqlite.sqlite_path}".\n')
 
 
 def load_database() -> CourseDatabase:
@@ -273,8 +803,61 @@ def load_database() -> CourseDatabase:
     return db
 
 
+def open_database(database_format: str = None):
+    """Opens the course database for looking up courses with get_course(), and sets mention_parse to find mentions of
+    its departments.
+    The mmap store and SQLite only read the courses that get looked up, so they open much faster than unpickling the
+    database. Falls back to the pickle if the chosen format hasn't been written.
+
+    :param database_format: 'mmap', 'sqlite', or 'pickle'. Defaults to DATABASE_FORMAT.
+    :type database_format: str
+    :return: the database
+    :rtype: CourseDatabase, db_mmap.MappedCourseStore, db_sqlite.SqliteCourseDatabase
+    """
+    if database_format is None:
+        database_format = DATABASE_FORMAT
+
+    db = None
+    if database_format == 'mmap':
+        import db_mmap
+        if os.path.isfile(db_mmap.store_path):
+            db = db_mmap.MappedCourseStore()
+
+    if database_format == 'sqlite':
+        import db_sqlite
+        if os.path.isfile(db_sqlite.sqlite_path):
+            db = db_sqlite.SqliteCourseDatabase()
+
+    if db is None:
+        db = load_database()
+
+    # find mentions of the departments in this database, instead of the default list in departments.py
+    mention_parse.set_department_codes(db.dept_codes())
+    return db
+
+
+def _migrate_database() -> None:
+    """Loads the database and saves it again, so a pickle from before __slots__ is rewritten in the compact format."""
+    size_before = os.path.getsize(_database_pickle_path)
+    db = load_database()
+
+    with open(_database_pickle_path, 'wb') as file:
+        pickle.dump(db, file)
+    file.close()
+    print(f'Rewrote "{_database_pickle_path}": {size_before:,} bytes -> {os.path.getsize(_database_pickle_path):,} bytes.')
+
+
+# db_extra imports from this module, so it's imported last, once everything it needs is defined. When db_core is ran on
+# its own, db_extra imports a second copy of db_core to call back into, and that copy imports db_extra here too.
+import db_extra as extras
+
 if __name__ == "__main__":
-    import db_extra as extras
+    OFFLINE = '--offline' in sys.argv
+    if '--parallel-parse' in sys.argv:
+        PARSE_WORKERS = os.cpu_count()
 
-    _save_database()
+    if '--migrate' in sys.argv:
+        _migrate_database()
+    else:
+        _save_database(incremental = '--incremental' in sys.argv)
     # print(load_database())
@@ -1,37 +1,57 @@
 """Stuff for the special cases for database build."""
 
-from typing import List
+from typing import List, Dict, Tuple
 import re
 from db_core import Course, Department, DEBUG, regex_course_num, get_soup_object, has_course_number, get_course
-
-lit_department_codes = {'Literature': 'lit',
-                        'Creative Writing': 'ltcr',
-                        'English-Language Literatures': 'ltel',
-                        'French Literature': 'ltfr',
-                        'German Literature': 'ltge',
-                        'Greek Literature': 'ltgr',
-                        'Latin Literature': 'ltin',
-                        'Italian Literature': 'ltit',
-                        'Modern Literary Studies': 'ltmo',
-                        'Pre- and Early Modern Literature': 'ltpr',
-                        'Spanish/Latin American/Latino Literatures': 'ltsp',
-                        'World Literature and Cultural Studies': 'ltwl'}
+from departments import lit_department_codes
 
 # used only for college eight, those bastards
 _regex_course_name = re.compile("[A-Za-z :']+\.?")
 
 
-def is_last_course_in_p(strong_tag) -> bool:
+class PageIndex:
+    """Things about a page worked out once, so the special case checks don't search the page again for every course."""
+
+    def __init__(self, every_strong_tag: list):
+        """Finds in one pass where each <strong> tag is among the <strong> tags in its parent.
+        This is the same as calling parent.find_all('strong') for each tag, without searching each parent again.
+
+        :param every_strong_tag: every <strong> tag in the page's main content, in document order
+        :type every_strong_tag: list
+        """
+        strongs_under = {}  # id of a tag -> number of <strong> tags inside it seen so far
+        parent_and_index = {}
+
+        for tag in every_strong_tag:
+            parent_and_index[id(tag)] = (id(tag.parent), strongs_under.get(id(tag.parent), 0))
+            for ancestor in tag.parents:
+                strongs_under[id(ancestor)] = strongs_under.get(id(ancestor), 0) + 1
+
+        # id of a <strong> tag -> (its index among the <strong> tags in its parent, how many are in its parent)
+        self.strong_positions: Dict[int, Tuple[int, int]] = \
+            {tag_id: (index, strongs_under[parent_id]) for tag_id, (parent_id, index) in parent_and_index.items()}
+
+        # id of a tag -> name of the lit sub-department it's under, filled in by get_real_lit_dept()
+        self.lit_depts: Dict[int, str] = {}
+
+
+def is_last_course_in_p(strong_tag, page_index: PageIndex = None) -> bool:
     """Whether the <strong> tag is in the last course in the paragraph.
 
     :param strong_tag: tag like <strong>1A.</strong>
     :type strong_tag: Tag
+    :param page_index: if given, looks up the tag's position instead of searching its paragraph
+    :type page_index: PageIndex
     :return: whether the tag is the last course in the paragraph
     :rtype: bool
     """
-    strongs_in_parent_p = strong_tag.parent.find_all('strong')
-    index = strongs_in_parent_p.index(strong_tag)
-    distance_to_end = len(strongs_in_parent_p) - index
+    if page_index is not None:
+        index, num_strongs = page_index.strong_positions[id(strong_tag)]
+    else:
+        strongs_in_parent_p = strong_tag.parent.find_all('strong')
+        index = strongs_in_parent_p.index(strong_tag)
+        num_strongs = len(strongs_in_parent_p)
+    distance_to_end = num_strongs - index
     return distance_to_end <= 4
 
 
@@ -115,26 +135,40 @@ def get_first_course_no_bold(dept_name: str, first_strong_tag) -> Course:
     return Course(dept_name, number_1, first_strong_tag.text[:-1], description)
 
 
-def get_real_lit_dept(num_tag) -> str:
+def get_real_lit_dept(num_tag, page_index: PageIndex = None) -> str:
     """Gets the department for a course in the lit page, which has many sub-departments.
 
     :param num_tag: Tag of the number of a course
     :type: num_tag: Tag
+    :param page_index: if given, remembers the department of every tag walked past, so later walks stop there
+    :type page_index: PageIndex
     :return: name of the department the course actually is in
     :rtype str
     """
     parent = num_tag.parent
+    walked_past = []
 
     while parent.name != 'h1':
+        if page_index is not None and id(parent) in page_index.lit_depts:
+            real_dept = page_index.lit_depts[id(parent)]
+            break
+        walked_past.append(parent)
         parent = parent.previous_sibling
-    real_dept = parent.text
+    else:
+        real_dept = parent.text
+
+    if page_index is not None:
+        for tag in walked_past:
+            page_index.lit_depts[id(tag)] = real_dept
 
     return real_dept
 
 
-def get_lit_depts() -> List[Department]:
+def get_lit_depts(html: str = None) -> List[Department]:
     """Makes departments for all the sub-departments on the lit page.
 
+    :param html: already downloaded html of the lit page. If None, the page is requested.
+    :type html: str
     :return: list of Department objects
     :rtype: list
     """
@@ -145,15 +179,16 @@ def get_lit_depts() -> List[Department]:
     for dept_code in lit_department_codes.values():
         lit_depts[dept_code] = Department(dept_code)
 
-    soup = get_soup_object('lit')
+    soup = get_soup_object('lit', html)
     every_strong_tag = soup.select("div.main-content strong")
+    page_index = PageIndex(every_strong_tag)
     numbers_in_strongs = []
     for tag in every_strong_tag:
         if has_course_number(tag.text):
             numbers_in_strongs.append(tag)
 
     for num_tag in numbers_in_strongs:
-        temp_course = get_course('lit', num_tag)
+        temp_course = get_course('lit', num_tag, page_index)
         if temp_course is None:
             continue
         lit_depts[temp_course.dept].add_course(temp_course)
@@ -0,0 +1,153 @@
+"""
+Read-only course store in one file, opened with mmap so a lookup only reads the pages of the file it needs.
+Bot processes on the same host share those pages through the page cache instead of each unpickling the database.
+
+File layout, all integers little-endian uint32:
+    magic b'UCSCDB2\\n', number of courses, department codes offset, department codes length
+    one entry per course, sorted by key: key offset, key length, record offset, record length
+    blob of utf-8 strings the offsets point into. A key is 'dept number', like 'cmps 012B'.
+    A record is dept, number, name, and description separated by '\\x1f'.
+    The department codes of the courses, separated by '\\x1f', are last in the blob, so they are read without
+    reading every key.
+"""
+
+from typing import Optional, List
+import mmap
+import os
+import struct
+from db_core import CourseDatabase, Course, load_database  # CourseDatabase is also needed to de-pickle the database
+
+_magic = b'UCSCDB2\n'
+_header = struct.Struct('<8sIII')
+_entry = struct.Struct('<IIII')
+_separator = '\x1f'
+
+store_path = os.path.join(os.path.dirname(__file__), 'pickle', 'course_store.bin')
+
+
+def _make_key(dept: str, number: str) -> bytes:
+    """Key a course is sorted and looked up by.
+
+    :param dept: department code, like 'cmps'
+    :type dept: str
+    :param number: padded course number, like '012B'
+    :type number: str
+    :return: key like b'cmps 012B'
+    :rtype: bytes
+    """
+    return (dept + ' ' + number).encode('utf-8')
+
+
+def write_store(db: CourseDatabase, path: str = store_path) -> None:
+    """Writes every course in the database to a store file.
+
+    :param db: database to write
+    :type db: CourseDatabase
+    :param path: file to write
+    :type path: str
+    """
+    keyed_courses = sorted((_make_key(course.dept, course.number), course)
+                           for dept in db.depts.values() for course in dept.courses.values())
+
+    entries = []
+    blob = bytearray()
+    for key, course in keyed_courses:
+        record = _separator.join([course.dept, course.number, course.name, course.description]).encode('utf-8')
+        entries.append(_entry.pack(len(blob), len(key), len(blob) + len(key), len(record)))
+        blob += key + record
+
+    dept_codes = _separator.join(dict.fromkeys(course.dept for _, course in keyed_courses)).encode('utf-8')
+    dept_codes_offset = len(blob)
+    blob += dept_codes
+
+    with open(path + '.tmp', 'wb') as file:
+        file.write(_header.pack(_magic, len(entries), dept_codes_offset, len(dept_codes)))
+        file.write(b''.join(entries))
+        file.write(blob)
+    file.close()
+    os.replace(path + '.tmp', path)
+
+
+class MappedCourseStore:
+    """Looks up courses in a store file written by write_store(), without reading the whole file."""
+
+    def __init__(self, path: str = store_path):
+        """
+        :param path: store file to open
+        :type path: str
+        """
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        file.close()
+
+        magic, self.num_courses, self._dept_codes_offset, self._dept_codes_length = _header.unpack_from(self._map, 0)
+        if magic != _magic:
+            raise ValueError(f'"{path}" is not a course store, or is from an older version. Run db_mmap.py again.')
+        self._blob_start = _header.size + self.num_courses * _entry.size
+
+    def _entry_at(self, index: int) -> tuple:
+        """Reads the index-th entry.
+
+        :param index: which entry
+        :type index: int
+        :return: key offset, key length, record offset, record length
+        :rtype: tuple
+        """
+        return _entry.unpack_from(self._map, _header.size + index * _entry.size)
+
+    def _key_at(self, index: int) -> bytes:
+        """Reads the key of the index-th entry.
+
+        :param index: which entry
+        :type index: int
+        :return: key like b'cmps 012B'
+        :rtype: bytes
+        """
+        key_offset, key_length, _, _ = self._entry_at(index)
+        start = self._blob_start + key_offset
+        return self._map[start:start + key_length]
+
+    def dept_codes(self) -> List[str]:
+        """Returns the department code of every course, without duplicates.
+
+        :return: department codes, like 'cmps'
+        :rtype: list
+        """
+        start = self._blob_start + self._dept_codes_offset
+        dept_codes = self._map[start:start + self._dept_codes_length].decode('utf-8')
+        return dept_codes.split(_separator) if dept_codes else []
+
+    def get_course(self, dept: str, number: str) -> Optional[Course]:
+        """Looks up a course by binary search over the sorted keys.
+
+        :param dept: department code, like 'cmps'
+        :type dept: str
+        :param number: padded course number, like '012B'
+        :type number: str
+        :return: the course, or None if there's no such course
+        :rtype: Course, None
+        """
+        key = _make_key(dept, number)
+        low, high = 0, self.num_courses
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == self.num_courses or self._key_at(low) != key:
+            return None
+
+        _, _, record_offset, record_length = self._entry_at(low)
+        start = self._blob_start + record_offset
+        return Course(*self._map[start:start + record_length].decode('utf-8').split(_separator))
+
+    def close(self) -> None:
+        """Unmaps the file."""
+        self._map.close()
+
+
+if __name__ == "__main__":
+    write_store(load_database())
+    print(f'Wrote {os.path.getsize(store_path):,} bytes to path "{store_path}".')
@@ -0,0 +1,96 @@
+"""
+Content-addressed store of registrar pages, so the database can be built again without the network.
+
+Each page is saved gzipped as snapshots/pages/<sha256 of html>.html.gz, so a page which has not changed is stored
+only once no matter how many builds save it. snapshots/index.pickle maps each page name to the hash of its latest html.
+"""
+
+from typing import Dict
+import gzip
+import hashlib
+import os
+import pickle
+
+_snapshot_dir = os.path.join(os.path.dirname(__file__), 'snapshots')
+
+
+def hash_html(html: str) -> str:
+    """Hash of a page's html, used as its address in the store and to tell if a page changed.
+
+    :param html: html of the page
+    :type html: str
+    :return: hex digest of the html
+    :rtype: str
+    """
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+class Snapshot:
+    """Registrar pages saved by database builds."""
+
+    def __init__(self, path: str = _snapshot_dir):
+        """
+        :param path: folder the snapshot is in
+        :type path: str
+        """
+        self.path = path
+        self._index_path = os.path.join(path, 'index.pickle')
+        self.index: Dict[str, str] = {}
+
+        if os.path.isfile(self._index_path):
+            with open(self._index_path, 'rb') as file:
+                self.index = pickle.load(file)
+            file.close()
+
+    def _page_path(self, digest: str) -> str:
+        """Path of the file holding the page with the given hash.
+
+        :param digest: hash of the page's html
+        :type digest: str
+        :return: path of the gzipped page
+        :rtype: str
+        """
+        return os.path.join(self.path, 'pages', digest + '.html.gz')
+
+    def add(self, page_name: str, html: str) -> None:
+        """Saves a page and points its name at it. Call save_index() when done adding.
+
+        :param page_name: name of the page, like 'cmps' or 'lit'
+        :type page_name: str
+        :param html: html of the page
+        :type html: str
+        """
+        digest = hash_html(html)
+        page_path = self._page_path(digest)
+
+        if not os.path.isfile(page_path):
+            os.makedirs(os.path.dirname(page_path), exist_ok = True)
+            with gzip.open(page_path + '.tmp', 'wt', encoding = 'utf-8') as file:
+                file.write(html)
+            file.close()
+            os.replace(page_path + '.tmp', page_path)
+
+        self.index[page_name] = digest
+
+    def get(self, page_name: str) -> str:
+        """Reads the latest saved html of a page.
+
+        :param page_name: name of the page, like 'cmps' or 'lit'
+        :type page_name: str
+        :return: html of the page
+        :rtype: str
+        """
+        if page_name not in self.index:
+            raise KeyError(f'page "{page_name}" is not in the snapshot at "{self.path}"')
+
+        with gzip.open(self._page_path(self.index[page_name]), 'rt', encoding = 'utf-8') as file:
+            html = file.read()
+        file.close()
+        return html
+
+    def save_index(self) -> None:
+        """Writes to disk which page each name points at."""
+        os.makedirs(self.path, exist_ok = True)
+        with open(self._index_path, 'wb') as file:
+            pickle.dump(self.index, file)
+        file.close()
@@ -0,0 +1,125 @@
+"""
+Course database in SQLite, with the same get_course() lookup as CourseDatabase.
+Unlike the pickle, one department can be replaced without rewriting the whole file.
+"""
+
+from typing import Optional, Iterable, List
+import os
+import sqlite3
+from db_core import CourseDatabase, Department, Course, load_database  # also needed to de-pickle the database
+
+sqlite_path = os.path.join(os.path.dirname(__file__), 'pickle', 'course_database.sqlite')
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS courses (
+    dept TEXT NOT NULL,
+    number TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    PRIMARY KEY (dept, number)
+) WITHOUT ROWID
+'''
+
+# department code of every course, kept up to date by each write, so opening the database doesn't scan every course
+_depts_schema = '''
+CREATE TABLE IF NOT EXISTS depts (
+    dept TEXT PRIMARY KEY
+) WITHOUT ROWID
+'''
+
+
+class SqliteCourseDatabase:
+    """Looks up and stores courses in an SQLite file."""
+
+    def __init__(self, path: str = sqlite_path):
+        """
+        :param path: SQLite file to open, created if it doesn't exist
+        :type path: str
+        """
+        # lookups may come from more than one thread; sqlite3 serializes them
+        self._connection = sqlite3.connect(path, check_same_thread = False)
+        self._connection.execute(_schema)
+        self._connection.execute(_depts_schema)
+
+    @property
+    def num_courses(self) -> int:
+        """How many courses are in the database."""
+        return self._connection.execute('SELECT COUNT(*) FROM courses').fetchone()[0]
+
+    def dept_codes(self) -> List[str]:
+        """Returns the department code of every course, without duplicates.
+
+        :return: department codes, like 'cmps'
+        :rtype: list
+        """
+        dept_codes = [row[0] for row in self._connection.execute('SELECT dept FROM depts')]
+        if not dept_codes:
+            # written before the depts table was
+            dept_codes = [row[0] for row in self._connection.execute('SELECT DISTINCT dept FROM courses')]
+        return dept_codes
+
+    def get_course(self, dept: str, number: str) -> Optional[Course]:
+        """Looks up a course by its primary key.
+
+        :param dept: department code, like 'cmps'
+        :type dept: str
+        :param number: padded course number, like '012B'
+        :type number: str
+        :return: the course, or None if there's no such course
+        :rtype: Course, None
+        """
+        row = self._connection.execute('SELECT dept, number, name, description FROM courses '
+                                       'WHERE dept = ? AND number = ?', (dept, number)).fetchone()
+        if row is None:
+            return None
+        return Course(*row)
+
+    def write_database(self, db: CourseDatabase) -> None:
+        """Replaces every course with the courses in db, in one transaction.
+
+        :param db: database to write
+        :type db: CourseDatabase
+        """
+        with self._connection:
+            self._connection.execute('DELETE FROM courses')
+            self._insert_depts(db.depts.values())
+            self._update_dept_codes()
+
+    def upsert_depts(self, depts: Iterable[Department]) -> None:
+        """Replaces the courses of each department, in one transaction. Courses a department no longer has are removed.
+
+        :param depts: departments to write
+        :type depts: iterable
+        """
+        depts = list(depts)
+        with self._connection:
+            self._connection.executemany('DELETE FROM courses WHERE dept = ?', [(dept.name,) for dept in depts])
+            self._insert_depts(depts)
+            self._update_dept_codes()
+
+    def _insert_depts(self, depts: Iterable[Department]) -> None:
+        """Inserts every course of each department. Caller must be in a transaction.
+
+        :param depts: departments to insert
+        :type depts: iterable
+        """
+        self._connection.executemany('INSERT INTO courses (dept, number, name, description) VALUES (?, ?, ?, ?)',
+                                     ((course.dept, course.number, course.name, course.description)
+                                      for dept in depts for course in dept.courses.values()))
+
+    def _update_dept_codes(self) -> None:
+        """Fills the depts table from the courses. Caller must be in a transaction."""
+        self._connection.execute('DELETE FROM depts')
+        self._connection.execute('INSERT INTO depts (dept) SELECT DISTINCT dept FROM courses')
+
+    def close(self) -> None:
+        """Closes the connection."""
+        self._connection.close()
+
+
+if __name__ == "__main__":
+    # migrate the pickled database
+    sqlite_db = SqliteCourseDatabase()
+    sqlite_db.write_database(load_database())
+    print(f'Wrote {sqlite_db.num_courses} courses to path "{sqlite_path}".')
+    sqlite_db.close()
@@ -0,0 +1,39 @@
+"""
+Department codes. Kept apart from db_core, so modules which only need the codes, like mention_parse, don't import
+requests and BeautifulSoup.
+"""
+
+from typing import List
+
+# registrar urls which don't match the course dept code
+renamed_departments = {'eeb': 'bioe', 'mcdb': 'biol'}
+
+all_departments = [
+    "acen", "aplx", "ams", "art", "artg", "astr", "bioc", "mcdb", "eeb", "bme", "chem", "chin", "clni", "clte", "cmmu",
+    "cmpm", "cmpe", "cmps", "cowl", "cres", "crwn", "danm", "eart", "educ", "ee", "envs", "fmst", "film", "fren",
+    "game", "gree", "hebr", "his", "hisc", "ital", "japn", "jwst", "krsg", "laad", "latn", "lals", "lgst", "ling",
+    "math", "merr", "metx", "musc", "oaks", "ocea", "phil", "phye", "phys", "poli", "port", "punj", "russ", "scic",
+    "socd", "socy", "span", "sphs", "stev", "tim", "thea", "ucdc", "writ", "yidd", 'prtr', 'anth', 'psyc', 'havc',
+    'clei', 'econ', 'germ']
+
+lit_department_codes = {'Literature': 'lit',
+                        'Creative Writing': 'ltcr',
+                        'English-Language Literatures': 'ltel',
+                        'French Literature': 'ltfr',
+                        'German Literature': 'ltge',
+                        'Greek Literature': 'ltgr',
+                        'Latin Literature': 'ltin',
+                        'Italian Literature': 'ltit',
+                        'Modern Literary Studies': 'ltmo',
+                        'Pre- and Early Modern Literature': 'ltpr',
+                        'Spanish/Latin American/Latino Literatures': 'ltsp',
+                        'World Literature and Cultural Studies': 'ltwl'}
+
+
+def course_department_codes() -> List[str]:
+    """Returns the department code of every department, as courses are filed under, like 'bioe' instead of 'eeb'.
+
+    :return: list of department codes
+    :rtype: list
+    """
+    return [renamed_departments.get(name, name) for name in all_departments] + list(lit_department_codes.values())
@@ -5,16 +5,16 @@ Vastly superior version of find_mentions which is faster can can see:
 * letter-list mentions in a multi mention, e.g. "CS 4a, 37a/b, 15, 163w/x/y/z"
 """
 
-from typing import List
+from typing import List, Match, Iterable, Optional, Pattern, Tuple, Iterator, Any
+from concurrent.futures import ProcessPoolExecutor  # parses big batches of texts in parallel
+from collections import deque
+import functools
+import itertools
 import re
+import departments
 
-# from build_database._all_departments, with build_database._lit_department_codes.values() and "CS" and "CE"
-_pattern_depts = \
-    "acen|ams|anth|aplx|art|artg|astr|bioc|bme|ce|chem|chin|clei|clni|clte|cmmu|cmpe|cmpm|cmps|cowl|cres|" \
-    "crwn|cs|danm|eart|econ|educ|ee|bioe|envs|film|fmst|fren|game|germ|gree|havc|hebr|his|hisc|ital|japn|" \
-    "jwst|krsg|laad|lals|latn|lgst|ling|lit|ltcr|ltel|ltfr|ltge|ltgr|ltin|ltit|ltmo|ltpr|ltsp|ltwl|math|" \
-    "biol|merr|metx|musc|oaks|ocea|phil|phye|phys|poli|port|prtr|psyc|punj|russ|scic|socd|socy|span|sphs|" \
-    "stev|thea|tim|ucdc|writ|yidd"
+# other names people use for a department, and the department code they mean
+_department_aliases = {'cs': 'cmps', 'ce': 'cmpe'}
 
 # matches a letter-list mention: a mention of same number with list of letters, e.g. "CE 129A/B/C"
 _pattern_mention_letter_list = "(?:\d+(?:[A-Za-z] ?/ ?)+[A-Za-z])"
@@ -28,70 +28,126 @@ _pattern_mention_any = "(?:" + _pattern_mention_letter_list + "|" + _pattern_men
 # matches a delimiter in a multi-mention, e.g. "Math 21, 23b, 24 and 100"
 _pattern_delimiter = "(?:[,/ &+]|or|and|with)*"
 
-# matches a whole mention string - a department code then multiple course numbers and possibly multiple course letters.
-# e.g. matches "CS 10, 15a, or 35a/b/c"
-_pattern_final = \
-    "(?:^|\\b)(?:" + _pattern_depts + ") ?(?:" + _pattern_mention_any + _pattern_delimiter + ")*" + _pattern_mention_any
+# matches the course numbers of a whole mention string - multiple course numbers and possibly multiple course letters.
+# e.g. matches "10, 15a, or 35a/b/c" in "CS 10, 15a, or 35a/b/c"
+_pattern_numbers = "(?:" + _pattern_mention_any + _pattern_delimiter + ")*" + _pattern_mention_any
 
+# matches one course number in the numbers of a whole mention string, either a letter-list mention split into its
+# number and letters, or a normal mention
+_pattern_number = \
+    "(?P<list_num>\\d+)(?P<list_letters>(?:[A-Za-z] ?/ ?)+[A-Za-z])|(?P<normal>" + _pattern_mention_normal + ")"
 
-def _parse_letter_list(dept: str, list_letter_mention: str) -> List[str]:
-    """Given a string of one course number a list of letters, returns a list with one letter per number.
-    e.g. '129A/B/C' becomes ['129A', '129B', '129C']
+# compiled once, since parse_string() runs on every title, selftext, and comment
+_regex_numbers = re.compile(_pattern_numbers, re.IGNORECASE)
+_regex_number = re.compile(_pattern_number)
+_regex_normalize = re.compile("([a-zA-Z]+ ?)([0-9]+[A-Za-z]?)")
 
-    :param dept: the department the mention is in
-    :type dept: str
-    :param list_letter_mention: a string with one course number and a list of letters, e.g. '129A/B/C'
-    :type list_letter_mention: str
-    :return: a list of normal mentions, e.g. ['129A', '129B', '129C']
-    :rtype: list
-    """
-    # note this regex is not the same as _pattern_mention_letter_list
-    m = re.match(" ?(\d+) ?((?:[A-Za-z] ?/ ?)+[A-Za-z])", list_letter_mention)
-    num = m.group(1)
-    letters = m.group(2).split('/')
+# finds where mentions start. Use _get_regex_anchor().
+_regex_anchor: Optional[Pattern] = None
 
-    return_list = []
-    for l in letters:
-        return_list.append(dept + " " + num + l.strip())
 
-    return return_list
+def _trie_pattern(trie: dict) -> str:
+    """Turns a trie of department codes into a regex which matches any of them.
+    Codes with the same prefix share one branch, so the regex never tries more than one code per letter it reads,
+    instead of trying every code at every position like an alternation of the codes does.
 
+    :param trie: dict of <letter, trie of the rest of the codes>, where key '' marks the end of a code
+    :type trie: dict
+    :return: regex which matches any code in the trie, longest first
+    :rtype: str
+    """
+    branches = [re.escape(letter) + _trie_pattern(rest) for letter, rest in sorted(trie.items()) if letter]
+    if not branches:
+        return ''
 
-def _parse_multi_mention(multi_mention: str) -> List[str]:
-    """Parses multi-mentions into normal mentions.
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in trie:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
 
-    :param multi_mention: a multi-mention, e.g. "Math 21, 23b, 24 and 100"
-    :type multi_mention: str
-    :return: normal mentions from the multi-mention
-    :rtype: list
+
+def set_department_codes(codes: Iterable[str]) -> None:
+    """Sets which department codes mentions are found for, e.g. to the departments in a loaded CourseDatabase.
+    The aliases in _department_aliases are always found too.
+
+    :param codes: department codes, like 'cmps'
+    :type codes: iterable
     """
-    mentions = []
+    global _regex_anchor
 
-    # extract department code
-    match_dept = re.search(_pattern_depts, multi_mention, re.IGNORECASE)
-    dept = multi_mention[match_dept.start():match_dept.end()].lower()
-    if dept == 'cs':
-        dept = 'cmps'
-    if dept == 'ce':
-        dept = 'cmpe'
+    trie = {}
+    for code in set(code.lower() for code in codes) | _department_aliases.keys():
+        node = trie
+        for letter in code:
+            node = node.setdefault(letter, {})
+        node[''] = {}
 
-    # the rest of the string, past department code
-    rest = multi_mention[match_dept.end():]
+    # a department code followed by a course number, e.g. "CS " in "CS 10, 15a, or 35a/b/c"
+    _regex_anchor = re.compile('\\b(?P<dept>' + _trie_pattern(trie) + ') ?(?=\\d)', re.IGNORECASE)
 
-    # look for letter-list mentions, like "129a/b/c"
-    mentions_letter_list = re.findall(_pattern_mention_letter_list, rest)
-    for m in mentions_letter_list:
-        mentions.extend(_parse_letter_list(dept, m))
 
-    # take out letter-list mentions, if any
-    rest = re.sub(_pattern_mention_letter_list, "", rest)
+def _get_regex_anchor() -> Pattern:
+    """Returns the regex which finds where mentions start, built from every department in departments.py the first
+    time unless set_department_codes() was already called, like db_core.open_database() does.
 
-    # look for normal mentions, like "12" or "12a"
-    men_normal = re.findall(_pattern_mention_normal, rest)
-    for m in men_normal:
-        mentions.append(dept + ' ' + m)
+    :return: the regex
+    :rtype: Pattern
+    """
+    if _regex_anchor is None:
+        set_department_codes(departments.course_department_codes())
+    return _regex_anchor
 
-    return mentions
+
+def _parse_multi_mention(str_: str, anchor: Match, numbers: Match) -> List[str]:
+    """Parses a multi-mention into normal mentions, reading the numbers straight out of the string it was found in.
+    Letter-list mentions come first, then normal mentions.
+
+    :param str_: string the multi-mention was found in
+    :type str_: str
+    :param anchor: match of the anchor regex, e.g. for "Math " in "Math 21, 23b, 24 and 100"
+    :type anchor: Match
+    :param numbers: match of _regex_numbers, e.g. for "21, 23b, 24 and 100"
+    :type numbers: Match
+    :return: normal mentions from the multi-mention
+    :rtype: list
+    """
+    dept = anchor.group('dept').lower()
+    dept = _department_aliases.get(dept, dept)
+
+    mentions_letter_list = []
+    mentions_normal = []
+
+    # one pass over the numbers, past the department code
+    for number in _regex_number.finditer(str_, numbers.start(), numbers.end()):
+        normal = number.group('normal')
+        if normal is not None:
+            # a normal mention, like "12" or "12a"
+            mentions_normal.append(dept + ' ' + normal)
+        else:
+            # a letter-list mention, like "129a/b/c"
+            num = number.group('list_num')
+            for letter in number.group('list_letters').split('/'):
+                mentions_letter_list.append(dept + ' ' + num + letter.strip())
+
+    return mentions_letter_list + mentions_normal
+
+
+@functools.lru_cache(maxsize = 4096)
+def normalize_mention(mention: str) -> str:
+    """Gaurentees a space between deptartment and number, removes leading zeroes, and expands aliases like CS to CMPS.
+    Two mentions of the same course are the same once normalized, e.g. 'CS12B' and 'cmps 012b' both become 'cmps 12b'.
+    Memoized, since the same few courses get mentioned over and over.
+
+    :param mention: the mention to normalize
+    :type mention: str
+    :return: the normalized mention
+    :rtype: str
+    """
+    matches = _regex_normalize.match(mention)
+    dept = matches.group(1).lower().strip()
+    num = matches.group(2).lower().lstrip("0")
+
+    return _department_aliases.get(dept, dept) + " " + num
 
 
 def parse_string(str_: str) -> List[str]:
@@ -110,9 +166,68 @@ def parse_string(str_: str) -> List[str]:
         return []
 
     mentions = []
+    regex_anchor = _get_regex_anchor()
 
-    multi_mentions = re.findall(_pattern_final, str_, re.IGNORECASE | re.MULTILINE)
-    for m in multi_mentions:
-        mentions.extend(_parse_multi_mention(m))
+    # run the number grammar only where a department code is followed by a number
+    anchor = regex_anchor.search(str_)
+    while anchor is not None:
+        numbers = _regex_numbers.match(str_, anchor.end())
+        mentions.extend(_parse_multi_mention(str_, anchor, numbers))
+        anchor = regex_anchor.search(str_, numbers.end())
 
     return mentions
+
+
+def _init_parse_worker(anchor_pattern: str) -> None:
+    """Runs once in each parse_many() worker process, so workers find the same departments as the parent process.
+
+    :param anchor_pattern: pattern of the parent's anchor regex
+    :type anchor_pattern: str
+    """
+    global _regex_anchor
+    _regex_anchor = re.compile(anchor_pattern, re.IGNORECASE)
+
+
+def _parse_chunk(chunk: List[Tuple[Any, str]]) -> List[Tuple[Any, List[str]]]:
+    """Finds mentions in a chunk of texts. Runs in a parse_many() worker process.
+
+    :param chunk: list of (text id, text)
+    :type chunk: list
+    :return: list of (text id, mentions)
+    :rtype: list
+    """
+    return [(text_id, parse_string(text)) for text_id, text in chunk]
+
+
+def parse_many(texts: Iterable[Tuple[Any, str]], processes: int = None,
+               chunk_size: int = 500) -> Iterator[Tuple[Any, List[str]]]:
+    """Finds mentions in many texts, like every comment of many archived posts. Texts are read as they are needed, and
+    results are yielded in the same order as the texts.
+
+    :param texts: iterable of (text id, text). The id can be anything, like a comment id.
+    :type texts: iterable
+    :param processes: how many worker processes to parse in. Parses in this process if None or 1.
+    :type processes: int
+    :param chunk_size: how many texts to send to a worker at a time
+    :type chunk_size: int
+    :return: iterator of (text id, mentions in the text)
+    :rtype: iterator
+    """
+    if processes is None or processes <= 1:
+        for text_id, text in texts:
+            yield text_id, parse_string(text)
+        return
+
+    texts = iter(texts)
+    chunks = iter(lambda: list(itertools.islice(texts, chunk_size)), [])
+
+    with ProcessPoolExecutor(max_workers = processes, initializer = _init_parse_worker,
+                             initargs = (_get_regex_anchor().pattern,)) as executor:
+        # keep a couple chunks per worker in flight, so a long stream of texts isn't all read into memory at once
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_parse_chunk, chunk))
+            if len(pending) >= processes * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -2,136 +2,303 @@
 Scrapes posts on /r/UCSC for mentions of courses.
 """
 
-from typing import Optional, List
-import re
+from typing import Optional, List, Dict
+from concurrent.futures import ThreadPoolExecutor  # scans submissions in parallel
+import itertools
+import queue
+import threading
+import time
 import praw
 import tools
 from tools import trunc_pad
 import mention_parse
 
+# how many submissions to expand and scan at the same time. Requests still go through tools.TokenBucketHandler,
+# so this only sets how many can wait on reddit at once. 1 scans one submission at a time. praw 3's Reddit isn't
+# thread-safe, so each worker logs in again, sharing the handler.
+SCAN_WORKERS = tools.REDDIT_CONNECTIONS
+
+# most of the subreddit's newest comments to read to find comments posted since a submission's scan checkpoint.
+# Submissions whose checkpoint is older than every comment read get their whole comment tree expanded again.
+RECENT_COMMENTS_LIMIT = 1000
+
+# how many comments reddit returns per request. How far back the first page reaches is used to guess how far back
+# RECENT_COMMENTS_LIMIT comments reach.
+_COMMENTS_PAGE_SIZE = 100
+
+# most scan checkpoints to keep on disk. The least recently scanned are dropped first.
+CHECKPOINTS_KEPT = 1000
+
+
+# seconds _remove_list_duplicates_preserve_order() took on each submission in the current find_mentions() run,
+# <submission id, seconds>
+_dedup_seconds: Dict[str, float] = {}
+
 
 class PostWithMentions:
     """Info about a specefic post and mentions found in that post."""
 
-    def __init__(self, post_id, mentions_list):
+    # PostWithMentions pickled before the author and title were kept get these
+    author_name = "[deleted]"
+    title = ""
+
+    def __init__(self, post_id, mentions_list, author_name = "[deleted]", title = ""):
         self.post_id = post_id
         self.mentions_list = mentions_list
+        # kept so post_comments can log the post without requesting it from reddit
+        self.author_name = author_name
+        self.title = title
 
     def __str__(self):
         return f"mentions in post id {self.post_id}: {self.mentions_list}"
 
 
-def _get_mentions_in_submission(counter: int, submission_: praw.objects.Submission) -> Optional[PostWithMentions]:
-    """Finds mentions of a course in a submission's title, selftext, and comments.
+def get_author_name(submission_: praw.objects.Submission) -> str:
+    """Returns the name of the submission's author.
 
-    :param counter: counter to print in table row
-    :type counter: int
     :param submission_: a praw submission object
     :type submission_: praw.objects.Submission
-    :return: a PostWithMentions object which has the post ID and a list of strings of mentions
-    :rtype: PostWithMentions, None
+    :return: the author's name, or "[deleted]"
+    :rtype: str
     """
-    mentions_list = []
-    mentions_list.extend(_get_mentions_in_string(submission_.title))
-    mentions_list.extend(_get_mentions_in_string(submission_.selftext))
-
-    submission_.replace_more_comments(limit = None, threshold = 0)
-    flat_comments = praw.helpers.flatten_tree(submission_.comments)
-
-    # TODO replace look-before-you-leap with try/except
-    for comment in flat_comments:
-        if comment.author is None or comment.author.name == 'ucsc-class-info-bot':
-            continue
-        mentions_list.extend(_get_mentions_in_string(comment.body))
-
-    mentions_list = _remove_list_duplicates_preserve_order(mentions_list)
-
     author = submission_.author
     if author is None:
-        author_name = "[deleted]"
+        return "[deleted]"
     else:
-        author_name = author.name
+        return author.name
 
-    print(" ".join([trunc_pad(str(counter), 'num'),
-                    trunc_pad(submission_.id, "id"),
-                    trunc_pad(author_name, "author"),
-                    trunc_pad(submission_.title, "title"),
-                    mentions_list]))
 
-    if not mentions_list:
-        return None
-    else:
-        return PostWithMentions(submission_.id, mentions_list)
+def get_post_mentions(submission_: praw.objects.Submission) -> List[str]:
+    """Finds mentions of courses in a submission's title and selftext.
+
+    :param submission_: a praw submission object
+    :type submission_: praw.objects.Submission
+    :return: list of strings of mentions
+    :rtype: list
+    """
+    post_mentions = []
+    for _, mentions in mention_parse.parse_many([('title', submission_.title), ('selftext', submission_.selftext)]):
+        post_mentions.extend(mentions)
+    return post_mentions
 
 
-def _get_mentions_in_string(source: str) -> List[str]:
-    """Finds mentions of courses (department and number) in a string. (Just calls a function in mentions_parse.py.)
+def merge_new_comments(checkpoint: tools.ScanCheckpoint, comments: list) -> float:
+    """Adds the mentions in comments the checkpoint hasn't seen yet to the checkpoint.
+
+    :param checkpoint: scan checkpoint of the submission the comments are in
+    :type checkpoint: tools.ScanCheckpoint
+    :param comments: praw comment objects
+    :type comments: list
+    :return: seconds spent removing duplicate mentions
+    :rtype: float
+    """
+    new_comments = [comment for comment in comments if comment.id not in checkpoint.comment_ids]
 
-    :param source: string to look for courses in.
-    :type source: str
-    :return: list of strings of course names
+    # TODO replace look-before-you-leap with try/except
+    texts = [(comment.id, comment.body) for comment in new_comments
+             if comment.author is not None and comment.author.name != 'ucsc-class-info-bot']
+    new_comment_mentions = []
+    for _, mentions in mention_parse.parse_many(texts):
+        new_comment_mentions.extend(mentions)
+
+    # the comments' mentions are kept normalized and without duplicates, so merging in new ones is cheap
+    start = time.perf_counter()
+    checkpoint.comment_mentions = \
+        _remove_list_duplicates_preserve_order(checkpoint.comment_mentions + new_comment_mentions)
+    dedup_seconds = time.perf_counter() - start
+    checkpoint.comment_ids.update(comment.id for comment in new_comments)
+    checkpoint.newest_utc = max([checkpoint.newest_utc] + [comment.created_utc for comment in new_comments])
+    return dedup_seconds
+
+
+def combine_mentions(post_mentions: List[str], checkpoint: tools.ScanCheckpoint) -> List[str]:
+    """Every mention in a submission, without duplicates: the ones in its title and selftext, then in its comments.
+
+    :param post_mentions: mentions in the submission's title and selftext
+    :type post_mentions: list
+    :param checkpoint: scan checkpoint of the submission
+    :type checkpoint: tools.ScanCheckpoint
+    :return: list of normalized mentions
     :rtype: list
     """
+    return _remove_list_duplicates_preserve_order(post_mentions + checkpoint.comment_mentions)
+
 
-    return mention_parse.parse_string(source)
+def _count_bot_comments(checkpoints: Dict[str, tools.ScanCheckpoint]) -> None:
+    """Counts the bot's comment in the checkpoint of each submission it commented on after the checkpoint was made,
+    so the submission's comment count still matches the checkpoint if nobody else commented.
 
+    :param checkpoints: dict of <submission id, ScanCheckpoint>. Updated.
+    :type checkpoints: dict
+    """
+    for submission_id, existing_comment in tools.load_posts_with_comments().items():
+        checkpoint = checkpoints.get(submission_id)
+        if checkpoint is not None and existing_comment.comment_id not in checkpoint.comment_ids:
+            # the bot's comment has no mentions to parse
+            checkpoint.comment_ids.add(existing_comment.comment_id)
+            checkpoint.num_comments += 1
 
-def _unify_mention_format(mention: str) -> str:
-    """Gaurentees a space between deptartment and number, removes leading zeroes, and expands CS and CE to CMPS and CMPE.
 
-    :param mention: the mention to reformat
-    :type mention: str
-    :return: the reformatted mention
-    :rtype: str
+def _get_recent_comments(reddit: praw.Reddit, submissions: List[praw.objects.Submission],
+                         checkpoints: Dict[str, tools.ScanCheckpoint]) -> Dict[str, list]:
+    """Reads the subreddit's newest comments, going back until every submission's scan checkpoint is reached, and
+    picks out the comments each submission got since its checkpoint. Submissions whose checkpoint the first page of
+    comments shows is too old to be reached within RECENT_COMMENTS_LIMIT comments aren't waited for.
+
+    :param reddit: authorized reddit praw object
+    :type reddit: praw.Reddit
+    :param submissions: submissions that have a checkpoint and a different comment count than it
+    :type submissions: list
+    :param checkpoints: dict of <submission id, ScanCheckpoint>
+    :type checkpoints: dict
+    :return: dict of <submission id, comments since its checkpoint, newest first>. A submission whose checkpoint is
+        older than every comment read is left out, since some of its new comments could be missing.
+    :rtype: dict
     """
-    matches = re.match("([a-zA-Z]+ ?)([0-9]+[A-Za-z]?)", mention)
-    dept = matches.group(1).lower().strip()
-    num = matches.group(2).lower().lstrip("0")
+    if not submissions:
+        return {}
+
+    link_ids = {'t3_' + submission.id: submission.id for submission in submissions}
+    oldest_needed = min(checkpoints[submission.id].newest_utc for submission in submissions)
+    recent_comments = {submission.id: [] for submission in submissions}
+
+    newest_read = oldest_read = float('inf')
+    num_read = 0
+    for num_read, comment in enumerate(reddit.get_comments('ucsc', limit = RECENT_COMMENTS_LIMIT), 1):
+        oldest_read = comment.created_utc
+        if num_read == 1:
+            newest_read = oldest_read
+        if oldest_read < oldest_needed:
+            break
+        submission_id = link_ids.get(comment.link_id)
+        if submission_id is not None:
+            recent_comments[submission_id].append(comment)
+
+        if num_read == _COMMENTS_PAGE_SIZE < RECENT_COMMENTS_LIMIT:
+            # don't read more pages for submissions whose checkpoint is too old to be reached anyway.
+            # They get their whole comment tree expanded, like when the guess is wrong and they aren't reached.
+            reach = newest_read - (newest_read - oldest_read) * RECENT_COMMENTS_LIMIT / _COMMENTS_PAGE_SIZE
+            oldest_needed = min((checkpoints[submission.id].newest_utc for submission in submissions
+                                 if checkpoints[submission.id].newest_utc >= reach), default = float('inf'))
+            if oldest_read < oldest_needed:
+                break
+    else:
+        if num_read < RECENT_COMMENTS_LIMIT:
+            oldest_read = float('-inf')  # read every comment the subreddit has
 
-    if dept == 'cs':
-        dept = 'cmps'
+    # comments from the same second as the oldest one read might not all have been read
+    return {submission_id: comments for submission_id, comments in recent_comments.items()
+            if checkpoints[submission_id].newest_utc > oldest_read}
 
-    if dept == 'ce':
-        dept = 'cmpe'
 
-    return dept + " " + num
+def _get_mentions_in_submission(counter: int, submission_: praw.objects.Submission,
+                                checkpoints: Dict[str, tools.ScanCheckpoint],
+                                recent_comments: Dict[str, list],
+                                reddit: Optional[praw.Reddit] = None) -> Optional[PostWithMentions]:
+    """Finds mentions of a course in a submission's title, selftext, and comments.
+    Only comments posted since the submission's scan checkpoint are read, and the checkpoint is updated.
 
+    :param counter: counter to print in table row
+    :type counter: int
+    :param submission_: a praw submission object
+    :type submission_: praw.objects.Submission
+    :param checkpoints: dict of <submission id, ScanCheckpoint>
+    :type checkpoints: dict
+    :param recent_comments: comments since their checkpoint of submissions with new comments, from
+        _get_recent_comments()
+    :type recent_comments: dict
+    :param reddit: login to expand the comment tree through, if it isn't the one submission_ came from
+    :type reddit: praw.Reddit
+    :return: a PostWithMentions object which has the post ID and a list of strings of mentions
+    :rtype: PostWithMentions, None
+    """
+    checkpoint = checkpoints.get(submission_.id)
+    if checkpoint is not None and submission_.num_comments == checkpoint.num_comments:
+        new_comments = []  # nothing to request
+    elif checkpoint is not None and submission_.id in recent_comments:
+        new_comments = recent_comments[submission_.id]
+    else:
+        # first scan, or too long since the last one: expand the whole comment tree
+        checkpoint = tools.ScanCheckpoint(submission_.created_utc)
+        if reddit is not None:
+            # the submission page comes with its comments, so this is the request expanding would make first anyway
+            submission_ = reddit.get_submission(submission_id = submission_.id)
+        submission_.replace_more_comments(limit = None, threshold = 0)
+        new_comments = praw.helpers.flatten_tree(submission_.comments)
+
+    # the title and selftext are in the listing already, and can be edited, so always parse them
+    post_mentions = get_post_mentions(submission_)
+    dedup_seconds = merge_new_comments(checkpoint, new_comments)
+    checkpoint.num_comments = submission_.num_comments
+    checkpoints.pop(submission_.id, None)
+    checkpoints[submission_.id] = checkpoint  # most recently scanned last
+
+    start = time.perf_counter()
+    mentions_list = combine_mentions(post_mentions, checkpoint)
+    _dedup_seconds[submission_.id] = dedup_seconds + time.perf_counter() - start
+
+    author_name = get_author_name(submission_)
 
-def _remove_list_duplicates_preserve_order(input_list: List[str]) -> List[str]:
-    """Removes duplicates from a list, while preserving order.
-    There's no built-in way to do this and a lot of weird ways to do it on Stack Overflow.
-    I just used this one http://stackoverflow.com/a/6764969
+    print(" ".join([trunc_pad(str(counter), 'num'),
+                    trunc_pad(submission_.id, "id"),
+                    trunc_pad(author_name, "author"),
+                    trunc_pad(submission_.title, "title"),
+                    str(mentions_list)]))
 
-    To do this easily without preserving order, do list(set(input_list)).
+    if not mentions_list:
+        return None
+    else:
+        return PostWithMentions(submission_.id, mentions_list, author_name, submission_.title)
+
+
+def _remove_list_duplicates_preserve_order(input_list: List[str]) -> List[str]:
+    """Normalizes mentions and removes duplicates from the list, while preserving order.
+    dict keys keep insertion order, so dict.fromkeys() is an ordered set.
 
     :param input_list: the list to remove duplicates from, while preserving order
     :type input_list: list
     :return: the list with duplicates removed, with order preserved
     :rtype: list
     """
-    uniques = []
+    return list(dict.fromkeys(map(mention_parse.normalize_mention, input_list)))
+
 
-    for element in input_list:
-        element = _unify_mention_format(element)
-        if element not in uniques:
-            uniques.append(element)
+def _print_dedup_stats() -> None:
+    """Prints how long removing duplicate mentions took in this find_mentions() run, and how often
+    mention_parse.normalize_mention() was already memoized."""
+    if not _dedup_seconds:
+        return
 
-    return uniques
+    slowest_id = max(_dedup_seconds, key = _dedup_seconds.get)
+    total = sum(_dedup_seconds.values())
+    cache_info = mention_parse.normalize_mention.cache_info()
+    print(f"dedup: {total * 1000:.2f} ms over {len(_dedup_seconds)} submissions, "
+          f"mean {total / len(_dedup_seconds) * 1e6:.0f} us, "
+          f"slowest {_dedup_seconds[slowest_id] * 1e6:.0f} us in post id {slowest_id}. "
+          f"normalizer cache: {cache_info.hits} hits, {cache_info.misses} misses.")
 
 
-def find_mentions(reddit: praw.Reddit, num_posts: int) -> List[PostWithMentions]:
+def find_mentions(reddit: praw.Reddit, num_posts: int, num_workers: int = SCAN_WORKERS,
+                  found_queue: Optional[queue.Queue] = None) -> List[PostWithMentions]:
     """Finds and saves to disk course mentions in new posts on /r/UCSC.
+    Rows are printed as each submission finishes, but the list returned is in the order of the listing.
 
     :param reddit: authorized reddit praw object
     :type reddit: praw.Reddit
     :param num_posts: the number of posts to look in.
     :type num_posts: int
+    :param num_workers: how many submissions to scan at the same time. Each worker logs in with tools.auth_reddit().
+    :type num_workers: int
+    :param found_queue: if given, each PostWithMentions is also put in it as soon as its submission is scanned, so
+        comments can be posted while the other submissions are still being scanned. None is put in it when scanning
+        ends, even if it ends with an error.
+    :type found_queue: queue.Queue
     :return: list of PostWithMentions instances
     :rtype: list
     """
 
     # use this to find mentions in only one post:
-    # tools.save_found_mentions([_get_mentions_in_submission(0, reddit.get_submission(submission_id = "4j4i0y"))])
+    # tools.save_found_mentions([_get_mentions_in_submission(0, reddit.get_submission(submission_id = "4j4i0y"), {}, {})])
     # return
 
     print(" ".join([trunc_pad("#", 'num'),
@@ -141,9 +308,45 @@ def find_mentions(reddit: praw.Reddit, num_posts: int) -> List[PostWithMentions]
 
     subreddit = reddit.get_subreddit('ucsc')
     list_of_posts_with_mentions = []
-
-    for counter, submission in enumerate(subreddit.get_new(limit = num_posts), start = 1):
-        found_mentions = _get_mentions_in_submission(counter, submission)
+    _dedup_seconds.clear()
+
+    worker_logins = threading.local()
+
+    def scan(counter: int, submission: praw.objects.Submission) -> Optional[PostWithMentions]:
+        worker_reddit = None
+        if num_workers > 1:
+            worker_reddit = getattr(worker_logins, 'reddit', None)
+            if worker_reddit is None:
+                worker_reddit = worker_logins.reddit = tools.auth_reddit(reddit.handler)
+        found_mentions_ = _get_mentions_in_submission(counter, submission, checkpoints, recent_comments, worker_reddit)
+        if found_queue is not None and found_mentions_ is not None:
+            found_queue.put(found_mentions_)  # waits while the queue is full
+        return found_mentions_
+
+    try:
+        # in the try, so found_queue gets its None even if reading the listings fails
+        checkpoints = tools.load_scan_checkpoints()
+        _count_bot_comments(checkpoints)
+        submissions = list(subreddit.get_new(limit = num_posts))
+        with_new_comments = [submission for submission in submissions if submission.id in checkpoints and
+                             submission.num_comments != checkpoints[submission.id].num_comments]
+        recent_comments = _get_recent_comments(reddit, with_new_comments, checkpoints)
+
+        if num_workers > 1:
+            with ThreadPoolExecutor(max_workers = num_workers) as executor:
+                # map() gives results in the order of the listing, whichever submission finishes first
+                results = list(executor.map(scan, itertools.count(1), submissions))
+        else:
+            results = [scan(counter, submission) for counter, submission in enumerate(submissions, start = 1)]
+    finally:
+        if found_queue is not None:
+            found_queue.put(None)
+
+    while len(checkpoints) > CHECKPOINTS_KEPT:
+        del checkpoints[next(iter(checkpoints))]
+    tools.save_scan_checkpoints(checkpoints)
+
+    for found_mentions in results:
         # TODO replace look-before-you-leap with try/except
         if found_mentions is not None:
             list_of_posts_with_mentions.append(found_mentions)
@@ -154,6 +357,7 @@ def find_mentions(reddit: praw.Reddit, num_posts: int) -> List[PostWithMentions]
     print("------------------------------")
     for post_with_mention in list_of_posts_with_mentions:
         print(str(post_with_mention))
+    _print_dedup_stats()
 
     return list_of_posts_with_mentions
 
@@ -1,39 +1,84 @@
 """Loads mentions from the last run of find_mentions.py and posts comments to reddit.com."""
 
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Iterable, Iterator
+from collections import deque
+import functools
+import queue
+import threading
 import praw
 import db_core
 import tools
 from tools import trunc_pad
 from tools import ExistingComment
-import re
+from write_scheduler import WriteScheduler
 
 from db_core import CourseDatabase, Department, Course  # need this to de-pickle course_database.pickle
 from mention_search_posts import PostWithMentions  # need this to de-pickle found_mentions.pickle
+from mention_search_posts import find_mentions
 
 Existing_pwc = Dict[str, ExistingComment]  # type of existing_posts_with_comments
 
+# comments posted or edited between saves of posts_with_comments.pickle. Each one is in the posting journal as soon as
+# it is made, so this only sets how long the journal gets.
+CHECKPOINT_EVERY = 50
 
-def _post_comment_helper(db, existing_posts_with_comments: Existing_pwc, new_mention_object: PostWithMentions,
-                         reddit: praw.Reddit) -> bool:
+# most PostWithMentions waiting between find_mentions() and post_comments_pipelined(). When it's full, scanning waits
+# for posting to catch up.
+FOUND_QUEUE_SIZE = 20
+
+# most fullnames reddit's info endpoint looks up in one request
+_info_batch_size = 100
+
+_comment_header = 'Classes mentioned in this thread:\n\n&nbsp;\n\n'
+_comment_footer = '---------------\n\n&nbsp;\n\n' + \
+                  '*I am a bot. If I screw up, please comment or message me. ' + \
+                  '[I\'m open source!](https://github.com/pfroud/ucsc-class-info-bot)*'
+
+
+def _resolve_mentions(course_index: db_core.CourseIndex,
+                      new_mention_object: PostWithMentions) -> Tuple[List[str], List[Course]]:
+    """Looks up each mention once, and filters out mentions that don't match a class.
+
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
+    :param new_mention_object: PostWithMentions object, which holds a post ID and a list of mentions
+    :type new_mention_object: PostWithMentions
+    :return: the mentions of a class, and their courses
+    :rtype: tuple
+    """
+    resolved = [(m, course_index.get(m)) for m in new_mention_object.mentions_list]
+    mentions_new = [m for m, course in resolved if course is not None]
+    courses_new = [course for m, course in resolved if course is not None]
+    return mentions_new, courses_new
+
+
+def _post_comment_helper(course_index: db_core.CourseIndex, existing_posts_with_comments: Existing_pwc,
+                         new_mention_object: PostWithMentions, reddit: praw.Reddit,
+                         prefetched: Optional[Dict[str, object]] = None,
+                         scheduler: Optional[WriteScheduler] = None) -> bool:
     """Posts a comment on the submission with info about the courses mentioned.
+    Nothing is requested from reddit unless a comment is actually added or edited.
 
-    :param db: course database with info
-    :type db: CourseDatabase
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
     :param new_mention_object: PostWithMentions object, which holds a post ID and a list of mentions
     :type new_mention_object: PostWithMentions
     :param reddit: authorized reddit praw object
     :type reddit: praw.Reddit
-    :return: whether a comment was submitted or edited (based only on mentions, not on actually_do_it)
+    :param prefetched: submissions and comments from _prefetch_things(). Ones not in it are requested one at a time.
+    :type prefetched: dict
+    :param scheduler: if given, the comment is queued in it instead of posted right away.
+        existing_posts_with_comments is updated once the comment is posted.
+    :type scheduler: WriteScheduler
+    :return: whether a comment was submitted or edited, or queued to be (based only on mentions, not on
+        actually_do_it)
     :rtype: bool
     """
-    submission_id = new_mention_object.post_id
-    submission_obj = reddit.get_submission(submission_id = submission_id)
-
-    mentions_new_unfiltered = new_mention_object.mentions_list
+    if prefetched is None:
+        prefetched = {}
 
-    # filter out mentions that don't match a class. (todo - find less shitty way to do this, probably try/except)
-    mentions_new = [m for m in mentions_new_unfiltered if _mention_to_course_object(db, m) is not None]
+    submission_id = new_mention_object.post_id
+    mentions_new, courses_new = _resolve_mentions(course_index, new_mention_object)
     if not mentions_new:
         return False
 
@@ -44,100 +89,118 @@ def _post_comment_helper(db, existing_posts_with_comments: Existing_pwc, new_men
 
         if mentions_new == mentions_previous:
             # if already have comment, but no new classes have been mentioned
-            _print_csv_row(submission_obj, 'No new mentions.', mentions_new, mentions_previous)
+            if scheduler is not None:
+                # an edit queued since, for mentions that have changed back, would make the comment out of date
+                scheduler.cancel_edit(already_commented_obj.comment_id)
+            _print_csv_row(new_mention_object, 'No new mentions.', mentions_new, mentions_previous)
             return False
 
         # comment needs to be updated
-        existing_comment = reddit.get_info(thing_id = 't1_' + already_commented_obj.comment_id)
-        existing_comment.edit(_get_comment(db, mentions_new))
-        existing_posts_with_comments[submission_id].mentions_list = mentions_new
-        tools.save_posts_with_comments(existing_posts_with_comments)
-        _print_csv_row(submission_obj, 'Edited comment.', mentions_new, mentions_previous)
+        def edit() -> None:
+            existing_comment = prefetched.get('t1_' + already_commented_obj.comment_id)
+            if existing_comment is None:
+                existing_comment = reddit.get_info(thing_id = 't1_' + already_commented_obj.comment_id)
+            existing_comment.edit(_get_comment(courses_new))
+            already_commented_obj.mentions_list = mentions_new
+            tools.journal_existing_comment(submission_id, already_commented_obj)
+            _print_csv_row(new_mention_object, 'Edited comment.', mentions_new, mentions_previous)
+
+        if scheduler is None:
+            edit()
+        else:
+            scheduler.edit(already_commented_obj.comment_id, edit)
         return True
 
     else:
         # no comment with class info, post a new one
-        new_comment = submission_obj.add_comment(_get_comment(db, mentions_new))
-        existing_posts_with_comments[submission_id] = ExistingComment(new_comment.id, mentions_new)
-        tools.save_posts_with_comments(existing_posts_with_comments)
-        _print_csv_row(submission_obj, 'Comment added.', mentions_new, [])
+        def reply() -> None:
+            submission_obj = prefetched.get('t3_' + submission_id)
+            if submission_obj is None:
+                submission_obj = reddit.get_submission(submission_id = submission_id)
+            new_comment = submission_obj.add_comment(_get_comment(courses_new))
+            existing_posts_with_comments[submission_id] = ExistingComment(new_comment.id, mentions_new)
+            tools.journal_existing_comment(submission_id, existing_posts_with_comments[submission_id])
+            _print_csv_row(new_mention_object, 'Comment added.', mentions_new, [])
+
+        if scheduler is None:
+            reply()
+        else:
+            scheduler.reply(submission_id, reply)
         return True
 
 
-def _get_comment(db: CourseDatabase, mention_list_: List[str]) -> Optional[str]:
-    """Returns a markdown comment with info about the classes mentioned in the list.
+def _prefetch_things(reddit: praw.Reddit, course_index: db_core.CourseIndex,
+                     existing_posts_with_comments: Existing_pwc,
+                     new_mentions_list: List[PostWithMentions]) -> Dict[str, object]:
+    """Looks up the submission of every post that needs a new comment, and the comment of every post whose comment
+    needs editing, in as few requests as reddit's info endpoint allows, instead of one request per post. Posts whose
+    comment is already up to date need nothing from reddit, so they are left out.
 
-    :param db: course database with info
-    :type db: CourseDatabase
-    :param mention_list_: list of mentions, like ['econ 1', 'cmps 5j']
-    :type mention_list_: list
-    :return: string of markdown comment
-    :rtype str, None
+    :param reddit: authorized reddit praw object
+    :type reddit: praw.Reddit
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
+    :param existing_posts_with_comments: posts that we have already commented on
+    :type existing_posts_with_comments: dict
+    :param new_mentions_list: list of mentions
+    :type new_mentions_list: list
+    :return: dict of <fullname, praw submission or comment>. Deleted things are left out.
+    :rtype: dict
     """
-    if not mention_list_:  # if list is empty
-        return None
-
-    markdown_string = 'Classes mentioned in this thread:\n\n&nbsp;\n\n'
-
-    for mention in mention_list_:
-        course_obj = _mention_to_course_object(db, mention)
-        if course_obj is None:
+    fullnames = []
+    for new_mention in new_mentions_list:
+        mentions_new, _ = _resolve_mentions(course_index, new_mention)
+        if not mentions_new:
             continue
-        markdown_string += _course_to_markdown(course_obj) + '&nbsp;\n\n'
-
-    markdown_string += '---------------\n\n&nbsp;\n\n' + \
-                       '*I am a bot. If I screw up, please comment or message me. ' + \
-                       '[I\'m open source!](https://github.com/pfroud/ucsc-class-info-bot)*'
-
-    return markdown_string
-
-
-def _mention_to_course_object(db: CourseDatabase, mention_: str) -> Optional[Course]:
-    """Converts mention of course to course object.
-
-    :param db: course database with course info
-    :type db: CourseDatabase
-    :param mention_: string of course mention, like 'econ 1'
-    :type mention_: str
-    :return: course object from the mention
-    :rtype: Course, None
+        existing_comment = existing_posts_with_comments.get(new_mention.post_id)
+        if existing_comment is None:
+            fullnames.append('t3_' + new_mention.post_id)
+        elif mentions_new != existing_comment.mentions_list:
+            fullnames.append('t1_' + existing_comment.comment_id)
+    fullnames = list(dict.fromkeys(fullnames))
+
+    prefetched = {}
+    for start in range(0, len(fullnames), _info_batch_size):
+        # with a limit, praw asks for the whole batch in one page
+        things = reddit.get_info(thing_id = fullnames[start:start + _info_batch_size], limit = _info_batch_size)
+        for thing in things or []:
+            prefetched[thing.fullname] = thing
+    return prefetched
+
+
+def _get_comment(courses: List[Course]) -> Optional[str]:
+    """Returns a markdown comment with info about the classes in the list.
+
+    :param courses: courses mentioned, from CourseIndex.get()
+    :type courses: list
+    :return: string of markdown comment
+    :rtype str, None
     """
-    split = mention_.split(' ')
-    dept = split[0].lower()
-    num = db_core.pad_course_num(split[1].upper())
-
-    try:
-        course_obj = db.depts[dept].courses[num]
-    except KeyError:
+    if not courses:  # if list is empty
         return None
 
-    return course_obj
+    return _render_comment(tuple(courses))
 
 
-def _course_to_markdown(course: Course) -> str:
-    """Returns a markdown representation of a course for use in reddit comments. Example:
-    '**ECON 1: Into to Stuff**
-    >We learn about econ and things.'
+@functools.lru_cache(maxsize = 256)
+def _render_comment(courses: Tuple[Course, ...]) -> str:
+    """Puts together the markdown comment for the courses. Memoized, since the same popular courses get mentioned
+    together over and over, and a comment is rendered again each time a post's comment is checked or edited.
 
-    :param course: Course to get markdown of
-    :type course: Course
-    :return: string of markdown of the course
-    :rtype: str
+    :param courses: courses mentioned
+    :type courses: tuple
+    :return: string of markdown comment
+    :rtype str
     """
+    return ''.join([_comment_header] + [course.markdown + '&nbsp;\n\n' for course in courses] + [_comment_footer])
 
-    num_leading_zeroes_stripped = re.sub("^0+", "", course.number)  # strip leading 0s only
-
-    markdown_string = f'**{course.dept.upper()} {num_leading_zeroes_stripped}: {course.name}**\n'
-    markdown_string += f'>{course.description}\n\n'
-
-    return markdown_string
 
-
-def _print_csv_row(submission, action: str, mentions_current: List[str], mentions_previous: List[str]) -> None:
+def _print_csv_row(post_with_mentions: PostWithMentions, action: str, mentions_current: List[str],
+                   mentions_previous: List[str]) -> None:
     """Prints a CSV row to stdout to be used as a log about what happened with a comment.
 
-    :param submission: Submission object that you are commenting on
-    :type submission:  praw.objects.Submission
+    :param post_with_mentions: the post that you are commenting on
+    :type post_with_mentions: PostWithMentions
     :param action: string describing the action taken
     :type action: str
     :param mentions_current: list of current class mentions
@@ -146,57 +209,202 @@ def _print_csv_row(submission, action: str, mentions_current: List[str], mention
     :type mentions_previous: list
     """
 
-    author = submission.author
-    if author is None:
-        author_name = "[deleted]"
-    else:
-        author_name = author.name
-
-    print(" ".join([trunc_pad(submission.id, "id"),
-                    trunc_pad(author_name, "author"),
-                    trunc_pad(submission.title, "title"),
+    print(" ".join([trunc_pad(post_with_mentions.post_id, "id"),
+                    trunc_pad(post_with_mentions.author_name, "author"),
+                    trunc_pad(post_with_mentions.title, "title"),
                     trunc_pad(action, "action"),
-                    mentions_current,
-                    mentions_previous]))
+                    str(mentions_current),
+                    str(mentions_previous)]))
 
 
-def post_comments(db: CourseDatabase, existing_posts_with_comments: Existing_pwc,
+def post_comments(course_index: db_core.CourseIndex, existing_posts_with_comments: Existing_pwc,
                   new_mentions_list: List[PostWithMentions], reddit: praw.Reddit) -> None:
-    """Recursivley goes through the mentions found in the last run of mention_search_posts.py and
-    posts a comment on each, if needed.
+    """Goes through the mentions found in the last run of mention_search_posts.py and posts a comment on each, if
+    needed. Each comment posted and each post handled goes in the posting journal right away, and everything is saved
+    every CHECKPOINT_EVERY comments and at the end, so a crash loses nothing and the next run starts where it stopped.
 
     :param existing_posts_with_comments: posts that we have already commented on
     :type existing_posts_with_comments: dict
-    :param db: course database with info
-    :type db: CourseDatabase
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
     :param new_mentions_list: list of mentions
     :type new_mentions_list: list
     :param reddit: authorized reddit praw object
     :type reddit: praw.Reddit
     """
-    if new_mentions_list:
-        new_mention = new_mentions_list.pop(0)
-    else:
-        print("No more mentions.")
-        return
-    _post_comment_helper(db, existing_posts_with_comments, new_mention, reddit)
-    if __name__ == "__main__":
-        tools.save_found_mentions(new_mentions_list)
-    post_comments(db, existing_posts_with_comments, new_mentions_list, reddit)
+    _post_comment_batches(course_index, existing_posts_with_comments, [new_mentions_list], reddit,
+                          save_found_mentions = __name__ == "__main__")
+
+
+def post_comments_pipelined(course_index: db_core.CourseIndex, existing_posts_with_comments: Existing_pwc,
+                            reddit: praw.Reddit, num_posts: int, save_found_mentions: bool = False) -> None:
+    """Runs find_mentions() in another thread, and posts a comment on each post as soon as it is scanned, instead of
+    waiting for every post to be scanned first. If find_mentions() fails, its error is raised once the posts it
+    scanned before have been commented on.
+
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
+    :param existing_posts_with_comments: posts that we have already commented on
+    :type existing_posts_with_comments: dict
+    :param reddit: authorized reddit praw object, used to post. The scanner logs in again with its handler.
+    :type reddit: praw.Reddit
+    :param num_posts: the number of posts to look in
+    :type num_posts: int
+    :param save_found_mentions: whether to also save mentions not handled yet to found_mentions.pickle at each
+        checkpoint, so post_comments.py can finish them after a crash
+    :type save_found_mentions: bool
+    """
+    found_queue = queue.Queue(maxsize = FOUND_QUEUE_SIZE)
+    scanner_errors = []
+    # praw 3's Reddit isn't thread-safe, so the scanner logs in again, sharing the handler and so the rate limit
+    scanner_reddit = tools.auth_reddit(reddit.handler)
+
+    def scan():
+        # an exception would otherwise only be printed by the thread, and the bot would exit as if it scanned every post
+        try:
+            find_mentions(scanner_reddit, num_posts, found_queue = found_queue)
+        except Exception as error:
+            scanner_errors.append(error)
+
+    # a daemon thread, so it can't keep the bot running if posting fails while it waits on a full queue
+    scanner = threading.Thread(target = scan, name = 'scanner', daemon = True)
+    scanner.start()
+    _post_comment_batches(course_index, existing_posts_with_comments, _queue_batches(found_queue), reddit,
+                          save_found_mentions, found_queue)
+    scanner.join()
+    if scanner_errors:
+        raise scanner_errors[0]
+
+
+def _queue_batches(found_queue: queue.Queue) -> Iterator[List[PostWithMentions]]:
+    """Yields PostWithMentions from the queue until it gives None. Waits for one, then takes any others already
+    waiting, so posts scanned at about the same time are prefetched together.
+
+    :param found_queue: queue find_mentions() puts PostWithMentions in
+    :type found_queue: queue.Queue
+    :return: iterator of lists of PostWithMentions
+    :rtype: iterator
+    """
+    while True:
+        batch = [found_queue.get()]
+        while batch[-1] is not None and len(batch) < _info_batch_size:
+            try:
+                batch.append(found_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if batch[-1] is None:
+            if len(batch) > 1:
+                yield batch[:-1]
+            return
+        yield batch
+
+
+def _post_comment_batches(course_index: db_core.CourseIndex, existing_posts_with_comments: Existing_pwc,
+                          batches: Iterable[List[PostWithMentions]], reddit: praw.Reddit,
+                          save_found_mentions: bool, found_queue: Optional[queue.Queue] = None) -> None:
+    """Posts a comment on each post, if needed, prefetching each batch's submissions and comments first.
+    New comments are posted as they come up, and edits at the end of each batch, paced by a WriteScheduler.
+
+    :param course_index: looks up the course of each mention
+    :type course_index: db_core.CourseIndex
+    :param existing_posts_with_comments: posts that we have already commented on
+    :type existing_posts_with_comments: dict
+    :param batches: lists of PostWithMentions
+    :type batches: iterable
+    :param reddit: authorized reddit praw object
+    :type reddit: praw.Reddit
+    :param save_found_mentions: whether to journal each post handled, and save the ones not handled yet to
+        found_mentions.pickle at each checkpoint
+    :type save_found_mentions: bool
+    :param found_queue: queue the batches are taken from, if they are. The PostWithMentions waiting in it are saved
+        with the ones not handled yet.
+    :type found_queue: queue.Queue
+    """
+    scheduler = WriteScheduler(reddit)
+    num_changed = 0
+    pending = deque()
+    written = []  # ids of posts whose comment is queued in scheduler, to journal as handled once it is written
+
+    for batch in batches:
+        pending = deque(batch)
+        prefetched = _prefetch_things(reddit, course_index, existing_posts_with_comments, batch)
+
+        while pending:
+            new_mention = pending.popleft()
+            if _post_comment_helper(course_index, existing_posts_with_comments, new_mention, reddit, prefetched,
+                                    scheduler):
+                num_changed += 1
+                written.append(new_mention.post_id)
+            elif save_found_mentions:
+                tools.journal_mention_done(new_mention.post_id)
+            scheduler.run_due()
+
+            if num_changed == CHECKPOINT_EVERY:
+                _flush_writes(scheduler, written, save_found_mentions)
+                _save_posting_state(existing_posts_with_comments, pending, save_found_mentions, found_queue)
+                num_changed = 0
+
+        _flush_writes(scheduler, written, save_found_mentions)
+
+    _save_posting_state(existing_posts_with_comments, pending, save_found_mentions)
+    print(f"No more mentions. {scheduler.num_merged} writes replaced by newer ones before being made.")
+
+
+def _flush_writes(scheduler: WriteScheduler, written: List[str], save_found_mentions: bool) -> None:
+    """Makes every write waiting in the scheduler, then journals their posts as handled.
+
+    :param scheduler: the writes
+    :type scheduler: WriteScheduler
+    :param written: ids of posts whose comment was queued. Emptied.
+    :type written: list
+    :param save_found_mentions: whether to journal the posts as handled
+    :type save_found_mentions: bool
+    """
+    scheduler.run_due(flush = True)
+    if save_found_mentions:
+        for post_id in written:
+            tools.journal_mention_done(post_id)
+    written.clear()
+
+
+def _save_posting_state(existing_posts_with_comments: Existing_pwc, pending: deque, save_found_mentions: bool,
+                        found_queue: Optional[queue.Queue] = None) -> None:
+    """Saves the posts with comments, and the mentions not handled yet.
+    Posts find_mentions() is still scanning aren't saved, but its scan checkpoints are only saved once it is done, so
+    the next run finds their mentions again.
+
+    :param existing_posts_with_comments: posts that we have already commented on
+    :type existing_posts_with_comments: dict
+    :param pending: PostWithMentions not handled yet
+    :type pending: deque
+    :param save_found_mentions: whether to save pending, and the PostWithMentions waiting in found_queue, to
+        found_mentions.pickle
+    :type save_found_mentions: bool
+    :param found_queue: queue of PostWithMentions scanned but not taken yet, and maybe the None that ends it
+    :type found_queue: queue.Queue
+    """
+    if save_found_mentions:
+        not_handled = list(pending)
+        if found_queue is not None:
+            with found_queue.mutex:  # a snapshot, while the scanner keeps adding to it
+                not_handled.extend(post for post in found_queue.queue if post is not None)
+        tools.save_found_mentions(not_handled)
+    tools.save_posts_with_comments(existing_posts_with_comments)
 
 
 def main():
     """something"""
-    existing_posts_with_comments = tools.load_posts_with_comments()
-    db = db_core.load_database()
-
     if __name__ == "__main__":
+        existing_posts_with_comments = tools.load_posts_with_comments()
+        course_index = db_core.CourseIndex(db_core.open_database())
+
         print(" ".join([trunc_pad("id"),
                         trunc_pad("author"),
                         trunc_pad("title"),
                         trunc_pad("action")]))
 
-        post_comments(db, existing_posts_with_comments, tools.load_found_mentions(), tools.auth_reddit())
+        post_comments(course_index, existing_posts_with_comments, tools.load_found_mentions(), tools.auth_reddit())
 
 
 main()
@@ -0,0 +1,69 @@
+"""Thread-safe token bucket used to keep concurrent requests under a rate limit."""
+
+from typing import Dict
+from urllib.parse import urlparse
+import threading
+import time
+
+
+class TokenBucket:
+    """Hands out tokens at a steady rate, allowing short bursts up to a capacity."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        :param rate: tokens added per second
+        :type rate: float
+        :param capacity: most tokens the bucket can hold, i.e. the largest burst allowed
+        :type capacity: float
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Adds the tokens earned since the last refill. Caller must hold the lock."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self) -> None:
+        """Takes one token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Keeps one TokenBucket per host, so each host is rate limited separately."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        :param rate: requests per second allowed to each host
+        :type rate: float
+        :param capacity: largest burst allowed to each host
+        :type capacity: float
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str) -> None:
+        """Waits until a request to the host of url is allowed.
+
+        :param url: url about to be requested
+        :type url: str
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.capacity)
+        bucket.acquire()
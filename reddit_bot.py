@@ -1,16 +1,24 @@
 """
-Runs find_mentions and post_comments.
+Runs find_mentions and post_comments, posting each comment as soon as its post is scanned. With --checkpoint, also saves
+mentions not handled yet to found_mentions.pickle, so post_comments.py can finish them if the bot crashes.
+With --daemon, watches /r/UCSC and replies as mentions are posted, until stopped.
 """
 
 from db_core import CourseDatabase, Department, Course  # need this to de-pickle course_database.pickle
-from mention_search_posts import find_mentions
-from post_comments import post_comments
+from post_comments import post_comments_pipelined
+import bot_daemon
+import db_core
 import tools
 import sys
 
 num_posts = 10
-if len(sys.argv) == 2:
-    num_posts = int(sys.argv[1])
+for arg in sys.argv[1:]:
+    if not arg.startswith('--'):
+        num_posts = int(arg)
 
 reddit = tools.auth_reddit()
-post_comments(find_mentions(reddit, num_posts), reddit)
+if '--daemon' in sys.argv:
+    bot_daemon.run(reddit)
+else:
+    post_comments_pipelined(db_core.CourseIndex(db_core.open_database()), tools.load_posts_with_comments(), reddit,
+                            num_posts, save_found_mentions = '--checkpoint' in sys.argv)
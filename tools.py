@@ -1,12 +1,31 @@
 """Functions to do reddit authentication, file saving and loading, and data structure printing,
 and varialbes used by multiple files."""
 
-from typing import List, Mapping
+from typing import List, Mapping, Dict, Optional, TYPE_CHECKING
 import pickle
 import praw
+import praw.handlers
+from requests.adapters import HTTPAdapter  # connection pool size
 import os
+import time
 import warnings
-from mention_search_posts import PostWithMentions
+from rate_limit import TokenBucket
+
+if TYPE_CHECKING:
+    # mention_search_posts imports this module, so only import it back for type checkers
+    from mention_search_posts import PostWithMentions
+
+# requests per second allowed to reddit's API, and the largest burst. Reddit averages its limit over ten minutes,
+# so short bursts are fine.
+REDDIT_REQUESTS_PER_SECOND = 1.0
+REDDIT_BURST = 10
+
+# most requests to reddit open at the same time, from threads sharing one TokenBucketHandler
+REDDIT_CONNECTIONS = 8
+
+# changes to posts_with_comments.pickle and found_mentions.pickle since they were last saved, one pickle per change.
+# See load_posts_with_comments().
+_journal_path = "pickle/posting_journal.pickle"
 
 
 # use this to set up PRAW for the first time:
@@ -50,6 +69,24 @@ class ExistingComment:
         return f"existing comment: {self.comment_id} -> {self.mentions_list}"
 
 
+class ScanCheckpoint:
+    """What find_mentions() saw in a submission's comments the last time it scanned the submission, so the next scan
+    only has to read comments posted since."""
+
+    def __init__(self, created_utc: float = 0.0):
+        """
+        :param created_utc: created_utc of the submission. No comment in it is older.
+        :type created_utc: float
+        """
+        self.num_comments = 0  # submission's comment count from the listing
+        self.newest_utc = created_utc  # created_utc of the newest comment seen, or of the submission if none were
+        self.comment_ids = set()  # ids of every comment seen
+        self.comment_mentions = []  # normalized mentions in the comments, without duplicates, in order first seen
+
+    def __str__(self):
+        return f"scan checkpoint: {len(self.comment_ids)} comments up to {self.newest_utc} -> {self.comment_mentions}"
+
+
 # widths of column for printing tables to console.
 _column_widths = {'num': 2,
                   "id": 7,
@@ -80,17 +117,65 @@ def trunc_pad(string_: str, column_name: str = None) -> str:
         return string_.ljust(width)
 
 
-def auth_reddit() -> praw.Reddit:
+class TokenBucketHandler(praw.handlers.DefaultHandler):
+    """PRAW handler which paces requests with a token bucket, instead of holding a lock for the whole of each request
+    like PRAW's default handler does. That lets threads sharing the handler have requests in flight at the same
+    time, while staying under reddit's rate limit."""
+
+    def __init__(self, bucket: TokenBucket):
+        """
+        :param bucket: bucket to take a token from before each request
+        :type bucket: TokenBucket
+        """
+        super().__init__()
+        self.bucket = bucket
+        # from the X-Ratelimit headers of the newest response: requests left in reddit's rate limit window, and
+        # time.monotonic() when the window resets. None until a response has the headers.
+        self.ratelimit_remaining: Optional[float] = None
+        self.ratelimit_reset_at = 0.0
+        adapter = HTTPAdapter(pool_maxsize = REDDIT_CONNECTIONS)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+    def request(self, _rate_domain, _rate_delay, **kwargs):
+        """Answers from DefaultHandler's cache, or else waits for a token and sends the request. Takes the same
+        arguments as DefaultHandler.request()."""
+        return self._send(**kwargs)
+
+    def _send_uncached(self, request, proxies, timeout, verify, **_):
+        """Waits for a token, then sends the request, without RateLimitHandler's lock, and keeps the rate limit
+        reddit reports in the response. Only responses from reddit get here, not ones from the cache, whose headers
+        are out of date."""
+        self.bucket.acquire()
+        response = praw.handlers.RateLimitHandler.request.__wrapped__(self, request, proxies, timeout, verify)
+
+        remaining = response.headers.get('x-ratelimit-remaining')
+        reset = response.headers.get('x-ratelimit-reset')
+        if remaining is not None and reset is not None:
+            self.ratelimit_remaining = float(remaining)
+            self.ratelimit_reset_at = time.monotonic() + float(reset)
+        return response
+
+    # DefaultHandler's caching around the request
+    _send = praw.handlers.DefaultHandler.with_cache(_send_uncached)
+
+
+def auth_reddit(handler: Optional[TokenBucketHandler] = None) -> praw.Reddit:
     """Loads access information and returns PRAW reddit api context.
 
+    :param handler: handler of another login to share, so both count against one rate limit. praw 3's Reddit isn't
+        thread-safe, so threads running at the same time each need their own login. A new handler if None.
+    :type handler: TokenBucketHandler
     :return: praw instance
     :rtype praw.Reddit
     """
 
+    if handler is None:
+        handler = TokenBucketHandler(TokenBucket(REDDIT_REQUESTS_PER_SECOND, REDDIT_BURST))
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")  # suppress PRAW warning about user agent containing 'bot'
         red = praw.Reddit(user_agent = 'desktop:ucsc-class-info-bot:v0.0.1 (by /u/ucsc-class-info-bot)',
-                          site_name = 'ucsc_bot')
+                          site_name = 'ucsc_bot', handler = handler)
 
     with open('pickle/access_information.pickle', 'rb') as file:
         access_information = pickle.load(file)
@@ -99,34 +184,139 @@ def auth_reddit() -> praw.Reddit:
     return red
 
 
+def _save_pickle(path: str, obj) -> None:
+    """Pickles obj to a temporary file then moves it over path, so a crash while saving leaves the old file whole.
+
+    :param path: file to save to
+    :type path: str
+    :param obj: object to pickle
+    :type obj: object
+    """
+    with open(path + '.tmp', 'wb') as file:
+        pickle.dump(obj, file)
+        file.flush()
+        os.fsync(file.fileno())
+    file.close()
+    os.replace(path + '.tmp', path)
+
+
+def _read_journal() -> list:
+    """Reads every entry in the posting journal. A half-written entry at the end, from a crash while appending it, is
+    cut off so entries appended after it can be read.
+
+    :return: list of entries, oldest first
+    :rtype: list
+    """
+    if not os.path.isfile(_journal_path):
+        return []
+
+    entries = []
+    with open(_journal_path, 'rb+') as file:
+        while True:
+            end_of_good_entries = file.tell()
+            try:
+                entries.append(pickle.load(file))
+            except (EOFError, pickle.UnpicklingError):
+                file.truncate(end_of_good_entries)  # only cuts anything off if the last entry is half-written
+                break
+    file.close()
+    return entries
+
+
+def _append_journal(entry: tuple, sync: bool) -> None:
+    """Appends an entry to the posting journal.
+
+    :param entry: ('comment', post id, ExistingComment) or ('done', post id)
+    :type entry: tuple
+    :param sync: whether to wait for the entry to be on disk
+    :type sync: bool
+    """
+    with open(_journal_path, 'ab') as file:
+        pickle.dump(entry, file)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    file.close()
+
+
+def journal_existing_comment(post_id: str, existing_comment: ExistingComment) -> None:
+    """Records on disk that a comment was posted or edited, without rewriting posts_with_comments.pickle.
+
+    :param post_id: id of the post the comment is on
+    :type post_id: str
+    :param existing_comment: the comment and the mentions now in it
+    :type existing_comment: ExistingComment
+    """
+    _append_journal(('comment', post_id, existing_comment), sync = True)
+
+
+def journal_mention_done(post_id: str) -> None:
+    """Records on disk that a post in found_mentions.pickle has been handled, without rewriting found_mentions.pickle.
+    Not waited on, since handling a post again only finds its comment already up to date.
+
+    :param post_id: id of the post
+    :type post_id: str
+    """
+    _append_journal(('done', post_id), sync = False)
+
+
 def load_posts_with_comments() -> Mapping[str, ExistingComment]:
-    """Loads from disk the dict of posts that have already been commented on.
+    """Loads from disk the dict of posts that have already been commented on: the last save, plus every comment in
+    the posting journal since.
 
     :return: dict of <string,ExistingComment> of posts that have already been commented on
     :rtype: dict
     """
-    if not os.path.isfile("pickle/posts_with_comments.pickle"):
-        return dict()
-
-    with open("pickle/posts_with_comments.pickle", 'rb') as file:
-        a_c = pickle.load(file)
-    file.close()
+    a_c = dict()
+    if os.path.isfile("pickle/posts_with_comments.pickle"):
+        with open("pickle/posts_with_comments.pickle", 'rb') as file:
+            a_c = pickle.load(file)
+        file.close()
+
+    for entry in _read_journal():
+        if entry[0] == 'comment':
+            a_c[entry[1]] = entry[2]
     return a_c
 
 
 def save_posts_with_comments(posts_with_comments: Mapping[str, ExistingComment]) -> None:
-    """Saves to disk the dict of posts that have already been commented on.
+    """Saves to disk the dict of posts that have already been commented on, and empties the posting journal.
 
     :param posts_with_comments:  dict of <string,ExistingComment> of posts that already have comments on them
     :type posts_with_comments: dict
     """
-    with open("pickle/posts_with_comments.pickle", 'wb') as file:
-        pickle.dump(posts_with_comments, file)
+    _save_pickle("pickle/posts_with_comments.pickle", posts_with_comments)
+    if os.path.isfile(_journal_path):
+        os.remove(_journal_path)
+
+
+def load_scan_checkpoints() -> Dict[str, ScanCheckpoint]:
+    """Loads from disk the scan checkpoint of each submission find_mentions() has scanned.
+
+    :return: dict of <submission id, ScanCheckpoint>
+    :rtype: dict
+    """
+    if not os.path.isfile("pickle/scan_checkpoints.pickle"):
+        return dict()
+
+    with open("pickle/scan_checkpoints.pickle", 'rb') as file:
+        checkpoints = pickle.load(file)
     file.close()
+    return checkpoints
 
 
-def load_found_mentions() -> List[PostWithMentions]:
-    """Loads from disk the list of found mentions from the last run of find_mentions().
+def save_scan_checkpoints(checkpoints: Dict[str, ScanCheckpoint]) -> None:
+    """Saves to disk the scan checkpoint of each submission find_mentions() has scanned.
+
+    :param checkpoints: dict of <submission id, ScanCheckpoint>
+    :type checkpoints: dict
+    """
+    _save_pickle("pickle/scan_checkpoints.pickle", checkpoints)
+
+
+def load_found_mentions() -> List['PostWithMentions']:
+    """Loads from disk the list of found mentions from the last run of find_mentions(), leaving out the ones the
+    posting journal says have been handled.
 
     :return: list of PostWithMentions objects
     :rtype: list
@@ -134,16 +324,19 @@ def load_found_mentions() -> List[PostWithMentions]:
     with open("pickle/found_mentions.pickle", 'rb') as file:
         mentions = pickle.load(file)
     file.close()
-    return mentions
+
+    done = {entry[1] for entry in _read_journal() if entry[0] == 'done'}
+    return [mention for mention in mentions if mention.post_id not in done]
 
 
-def save_found_mentions(found_mentions: List[PostWithMentions]) -> None:
+def save_found_mentions(found_mentions: List['PostWithMentions']) -> None:
     """Saves to disk mentions found from from the last run of find_mentions().
     This is used in both post_comments.py and in mention_search_posts.py so I have put it in tools.py.
 
     :param found_mentions: list of PostWithMentions objects
     :type found_mentions: list
     """
-    with open("pickle/found_mentions.pickle", 'wb') as file:
-        pickle.dump(found_mentions, file)
-    file.close()
+    # the journal's entries are about the old found mentions, so save the comments in it and empty it first
+    if os.path.isfile(_journal_path):
+        save_posts_with_comments(load_posts_with_comments())
+    _save_pickle("pickle/found_mentions.pickle", found_mentions)
@@ -0,0 +1,152 @@
+"""
+Schedules the bot's writes to reddit: new comments, and edits of comments it already posted.
+
+Writes are paced to fit the rate limit reddit reports in the X-Ratelimit headers of each response, which
+tools.TokenBucketHandler keeps. New comments go before edits, and edits of the same comment queued within
+EDIT_WINDOW_SECONDS of each other are made as one edit with the newest text, since a busy thread would otherwise get its
+comment edited every time a new course is mentioned.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+import time
+import praw
+
+# seconds an edit waits for newer edits of the same comment, which replace it, before it is made
+EDIT_WINDOW_SECONDS = 600
+
+
+class WriteScheduler:
+    """Writes waiting to be made to reddit. Not thread-safe: queue and run writes from one thread."""
+
+    def __init__(self, reddit: praw.Reddit, edit_window: float = EDIT_WINDOW_SECONDS):
+        """
+        :param reddit: authorized reddit praw object. Its handler's rate limit is read if it has one, like
+            tools.TokenBucketHandler.
+        :type reddit: praw.Reddit
+        :param edit_window: seconds an edit waits for newer edits of the same comment
+        :type edit_window: float
+        """
+        self._handler = reddit.handler
+        self.edit_window = edit_window
+        self._replies: Dict[str, Callable[[], None]] = {}  # <submission id, write>, oldest first
+        self._edits: Dict[str, Tuple[float, Callable[[], None]]] = {}  # <comment id, (when it's due, write)>
+        self._next_write_at = 0.0  # time.monotonic() of the soonest the next write may be made
+        self.num_merged = 0  # writes replaced by a newer write of the same comment, or cancelled
+
+    def __len__(self) -> int:
+        return len(self._replies) + len(self._edits)
+
+    def reply(self, submission_id: str, write: Callable[[], None]) -> None:
+        """Queues a new comment on a submission, replacing a new comment on the same submission still waiting.
+
+        :param submission_id: id of the submission
+        :type submission_id: str
+        :param write: function which posts the comment
+        :type write: function
+        """
+        if submission_id in self._replies:
+            self.num_merged += 1
+        self._replies[submission_id] = write
+
+    def edit(self, comment_id: str, write: Callable[[], None]) -> None:
+        """Queues an edit of a comment. It's made edit_window seconds after the first edit of the comment still
+        waiting was queued, and a newer edit of the same comment replaces it without waiting any longer.
+
+        :param comment_id: id of the comment
+        :type comment_id: str
+        :param write: function which edits the comment
+        :type write: function
+        """
+        due = time.monotonic() + self.edit_window
+        if comment_id in self._edits:
+            due = self._edits[comment_id][0]
+            self.num_merged += 1
+        self._edits[comment_id] = (due, write)
+
+    def cancel_edit(self, comment_id: str) -> None:
+        """Drops the edit of a comment still waiting, if there is one. For when the comment turns out to be up to date
+        after all, like when mentions change then change back within the edit window.
+
+        :param comment_id: id of the comment
+        :type comment_id: str
+        """
+        if self._edits.pop(comment_id, None) is not None:
+            self.num_merged += 1
+
+    def seconds_until_due(self) -> Optional[float]:
+        """Returns how long until the next write can be made.
+
+        :return: seconds, or None if no writes are waiting
+        :rtype: float, None
+        """
+        if self._replies:
+            due = self._next_write_at
+        elif self._edits:
+            due = max(self._next_write_at, min(due for due, _ in self._edits.values()))
+        else:
+            return None
+        return max(0.0, due - time.monotonic())
+
+    def run_due(self, flush: bool = False) -> None:
+        """Makes the writes that are due, new comments first, waiting between them as reddit's rate limit needs.
+        A write that fails with an error other than reddit's comment rate limit is dropped, and the error raised.
+
+        :param flush: whether to make every edit now, instead of waiting for its window
+        :type flush: bool
+        """
+        while True:
+            write = self._pop_due(flush)
+            if write is None:
+                return
+            kind, key, function = write
+
+            wait = self._next_write_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                function()
+            except praw.errors.RateLimitExceeded as error:
+                # reddit limits how often an account can comment, apart from the request rate limit
+                self._next_write_at = time.monotonic() + error.sleep_time
+                if kind == 'reply':
+                    self._replies[key] = function
+                else:
+                    self._edits[key] = (time.monotonic(), function)
+                if not flush:
+                    return
+                continue
+            self._next_write_at = time.monotonic() + self._write_interval()
+
+    def _pop_due(self, flush: bool) -> Optional[Tuple[str, str, Callable[[], None]]]:
+        """Takes the next write to make off the queue.
+
+        :param flush: whether every edit is due
+        :type flush: bool
+        :return: ('reply' or 'edit', submission or comment id, write), or None if no writes are due
+        :rtype: tuple, None
+        """
+        if self._replies:
+            submission_id = next(iter(self._replies))
+            return 'reply', submission_id, self._replies.pop(submission_id)
+
+        now = time.monotonic()
+        for comment_id, (due, write) in self._edits.items():
+            if flush or due <= now:
+                del self._edits[comment_id]
+                return 'edit', comment_id, write
+        return None
+
+    def _write_interval(self) -> float:
+        """Returns how long to wait before the next write, so the requests left in reddit's rate limit window are
+        spread over the rest of it.
+
+        :return: seconds
+        :rtype: float
+        """
+        remaining = getattr(self._handler, 'ratelimit_remaining', None)
+        if remaining is None:
+            return 0.0
+        seconds_left = max(0.0, self._handler.ratelimit_reset_at - time.monotonic())
+        if remaining < 1:
+            return seconds_left
+        return seconds_left / remaining